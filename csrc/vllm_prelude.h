@@ -0,0 +1,12 @@
+#pragma once
+
+// Force-included (`-include`) into the translation units that need the
+// native half/bfloat16 operators and conversions. The torch extension
+// builder disables them with `-D__CUDA_NO_HALF_*` / `-D__HIP_NO_HALF_*` on
+// the command line, which is processed before this header.
+#undef __CUDA_NO_HALF_OPERATORS__
+#undef __CUDA_NO_HALF_CONVERSIONS__
+#undef __CUDA_NO_BFLOAT16_CONVERSIONS__
+#undef __CUDA_NO_HALF2_OPERATORS__
+#undef __HIP_NO_HALF_CONVERSIONS__
+#undef __HIP_NO_HALF_OPERATORS__
@@ -73,7 +73,8 @@ html_theme_options = {
 # Mock out external dependencies here.
 autodoc_mock_imports = [
     "torch", "transformers", "psutil", "prometheus_client", "sentencepiece",
-    "vllm.cuda_utils", "vllm._C"
+    "vllm.cuda_utils", "vllm._C", "vllm._C_attention", "vllm._C_quantization",
+    "vllm._C_misc"
 ]
 
 for mock_target in autodoc_mock_imports:
@@ -1,11 +1,15 @@
-import contextlib
+import fnmatch
+import functools
+import hashlib
 import io
 import os
 import re
+import shutil
 import subprocess
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Set
+from typing import List, Set, Tuple
 
 from packaging.version import parse, Version
 import setuptools
@@ -31,12 +35,22 @@ NVIDIA_SUPPORTED_ARCHS = {"7.0", "7.5", "8.0", "8.6", "8.9", "9.0"}
 ROCM_SUPPORTED_ARCHS = {"gfx908", "gfx90a", "gfx906", "gfx926", "gfx928", "gfx936","gfx942", "gfx1100"}
 # SUPPORTED_ARCHS = NVIDIA_SUPPORTED_ARCHS.union(ROCM_SUPPORTED_ARCHS)
 
+# Patterns for extracting toolchain versions.
+_HIPCC_VER_RE = re.compile(r"HIP version: (\S+)")
+_NEURON_VER_RE = re.compile(r"__version__ = '(\S+)'")
+_NVCC_VER_RE = re.compile(r"release (\d+\.\d+)")
 
+
+_TORCH_HIP_VERSION = torch.version.hip
+_TORCH_CUDA_VERSION = torch.version.cuda
+
+
+@functools.lru_cache(maxsize=None)
 def _is_hip() -> bool:
-    return torch.version.hip is not None
+    return _TORCH_HIP_VERSION is not None
 
 
-def _is_neuron() -> bool:
+def _probe_neuron() -> bool:
     torch_neuronx_installed = True
     try:
         subprocess.run(["neuron-ls"], capture_output=True, check=True)
@@ -45,31 +59,18 @@ def _is_neuron() -> bool:
     return torch_neuronx_installed
 
 
-def _is_cuda() -> bool:
-    return (torch.version.cuda is not None) and not _is_neuron()
-
-
-# Compiler flags.
-CXX_FLAGS = ["-g", "-O2", "-std=c++17"]
-# TODO(woosuk): Should we use -O3?
-NVCC_FLAGS = ["-O2", "-std=c++17","--gpu-max-threads-per-block=1024"]
+@functools.lru_cache(maxsize=None)
+def _is_neuron() -> bool:
+    # A CUDA or ROCm build of torch cannot target Neuron, so there is no need
+    # to run neuron-ls.
+    if _TORCH_CUDA_VERSION is not None or _TORCH_HIP_VERSION is not None:
+        return False
+    return _NEURON_PROBE.result()
 
-if _is_hip():
-    if ROCM_HOME is None:
-        raise RuntimeError(
-            "Cannot find ROCM_HOME. ROCm must be available to build the package."
-        )
-    NVCC_FLAGS += ["-DUSE_ROCM"]
-    NVCC_FLAGS += ["-U__HIP_NO_HALF_CONVERSIONS__"]
-    NVCC_FLAGS += ["-U__HIP_NO_HALF_OPERATORS__"]
 
-if _is_cuda() and CUDA_HOME is None:
-    raise RuntimeError(
-        "Cannot find CUDA_HOME. CUDA must be available to build the package.")
-
-ABI = 1 if torch._C._GLIBCXX_USE_CXX11_ABI else 0
-CXX_FLAGS += [f"-D_GLIBCXX_USE_CXX11_ABI={ABI}"]
-NVCC_FLAGS += [f"-D_GLIBCXX_USE_CXX11_ABI={ABI}"]
+@functools.lru_cache(maxsize=None)
+def _is_cuda() -> bool:
+    return (_TORCH_CUDA_VERSION is not None) and not _is_neuron()
 
 
 def get_hipcc_rocm_version():
@@ -85,7 +86,7 @@ def get_hipcc_rocm_version():
         return None
 
     # Extract the version using a regular expression
-    match = re.search(r'HIP version: (\S+)', result.stdout)
+    match = _HIPCC_VER_RE.search(result.stdout)
     if match:
         # Return the version string
         return match.group(1)
@@ -94,9 +95,21 @@ def get_hipcc_rocm_version():
         return None
 
 
-def glob(pattern: str):
-    root = Path(__name__).parent
-    return [str(p) for p in root.glob(pattern)]
+# All C++/CUDA sources, collected with a single walk of `csrc/`.
+_CSRC_INDEX = sorted(
+    p.relative_to(ROOT_DIR).as_posix()
+    for p in Path(ROOT_DIR, "csrc").rglob("*")
+    if p.suffix in (".cu", ".cpp", ".cc", ".h", ".cuh"))
+
+
+def glob(pattern: str) -> List[str]:
+    """Find the sources under `csrc/` that match `pattern`."""
+    # Unlike pathlib, fnmatch lets `*` match `/`, so also match the depth.
+    depth = pattern.count("/")
+    return [
+        p for p in fnmatch.filter(_CSRC_INDEX, pattern)
+        if p.count("/") == depth
+    ]
 
 
 def get_neuronxcc_version():
@@ -110,7 +123,7 @@ def get_neuronxcc_version():
         content = fp.read()
 
     # Extract the version using a regular expression
-    match = re.search(r"__version__ = '(\S+)'", content)
+    match = _NEURON_VER_RE.search(content)
     if match:
         # Return the version string
         return match.group(1)
@@ -125,10 +138,10 @@ def get_nvcc_cuda_version(cuda_dir: str) -> Version:
     """
     nvcc_output = subprocess.check_output([cuda_dir + "/bin/nvcc", "-V"],
                                           universal_newlines=True)
-    output = nvcc_output.split()
-    release_idx = output.index("release") + 1
-    nvcc_cuda_version = parse(output[release_idx].split(",")[0])
-    return nvcc_cuda_version
+    match = _NVCC_VER_RE.search(nvcc_output)
+    if match is None:
+        raise RuntimeError("Could not find CUDA version in the nvcc output")
+    return parse(match.group(1))
 
 
 def get_pytorch_rocm_arch() -> Set[str]:
@@ -213,19 +226,156 @@ def get_torch_arch_list() -> Set[str]:
     return arch_list
 
 
+def get_sha(root: Union[str, Path]) -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root).decode('ascii').strip()
+    except Exception:
+        return 'Unknown'
+
+
+# Spawning the external tools probed below takes most of the setup.py startup
+# time, so run them concurrently and only wait for a result where it is used.
+_PROBES = ThreadPoolExecutor(max_workers=4)
+if _TORCH_CUDA_VERSION is None and _TORCH_HIP_VERSION is None:
+    _NEURON_PROBE = _PROBES.submit(_probe_neuron)
+if _is_hip():
+    _COMPILER_VERSION_PROBE = _PROBES.submit(get_hipcc_rocm_version)
+    _ROCM_ARCH_PROBE = _PROBES.submit(get_pytorch_rocm_arch)
+    _SHA_PROBE = _PROBES.submit(get_sha, os.path.abspath(ROOT_DIR))
+elif _TORCH_CUDA_VERSION is not None and CUDA_HOME is not None:
+    _COMPILER_VERSION_PROBE = _PROBES.submit(get_nvcc_cuda_version,
+                                             CUDA_HOME)
+_PROBES.shutdown(wait=False)
+
+CSRC_DIR = os.path.join(os.path.abspath(ROOT_DIR), "csrc")
+# Header that re-enables the half-precision operators disabled by torch.
+PRELUDE_HEADER = os.path.join(CSRC_DIR, "vllm_prelude.h")
+
+
+def abs_sources(sources: List[str]) -> List[str]:
+    """Resolve source paths relative to the repository root."""
+    return [os.path.join(os.path.abspath(ROOT_DIR), s) for s in sources]
+
+
+# Compiler flags.
+CXX_FLAGS = ["-O3", "-std=c++17"]
+NVCC_FLAGS = ["-O3", "-std=c++17", "--gpu-max-threads-per-block=1024"]
+# Extra flags for the kernels with an FP8 KV cache path.
+NVCC_FLAGS_FP8: List[str] = []
+# Keep debug symbols only when explicitly requested.
+if bool(int(os.getenv("VLLM_DEBUG", "0"))):
+    CXX_FLAGS += ["-g"]
+
 if _is_hip():
-    rocm_arches = get_pytorch_rocm_arch()
+    if ROCM_HOME is None:
+        raise RuntimeError(
+            "Cannot find ROCM_HOME. ROCm must be available to build the package."
+        )
+    NVCC_FLAGS += ["-DUSE_ROCM"]
+    NVCC_FLAGS += ["-include", PRELUDE_HEADER]
+    NVCC_FLAGS += ["-DHIP_FAST_MATH"]
+
+if _is_cuda() and CUDA_HOME is None:
+    raise RuntimeError(
+        "Cannot find CUDA_HOME. CUDA must be available to build the package.")
+
+# Fast math may change numerics, so it is opt-in on CUDA.
+if _is_cuda() and bool(int(os.getenv("VLLM_FAST_MATH", "0"))):
+    NVCC_FLAGS += ["--use_fast_math"]
+
+ABI = 1 if torch._C._GLIBCXX_USE_CXX11_ABI else 0
+CXX_FLAGS += [f"-D_GLIBCXX_USE_CXX11_ABI={ABI}"]
+NVCC_FLAGS += [f"-D_GLIBCXX_USE_CXX11_ABI={ABI}"]
+
+
+def strip_gencode_flags(flags: List[str]) -> List[str]:
+    """Remove all `-gencode <arch>` pairs and `-arch=` flags from `flags`."""
+    stripped = []
+    flag_iter = iter(flags)
+    for flag in flag_iter:
+        if flag == "-gencode":
+            next(flag_iter, None)
+        elif not flag.startswith("-arch="):
+            stripped.append(flag)
+    return stripped
+
+
+def get_num_physical_cores() -> int:
+    """Get the number of physical CPU cores available for the build."""
+    try:
+        import psutil
+        num_cores = psutil.cpu_count(logical=False)
+        if num_cores:
+            return num_cores
+    except ImportError:
+        pass
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+PUNICA_STAMP_PATH = os.path.join(ROOT_DIR, "build", ".punica_flags.sha")
+PUNICA_STAMP = None
+reuse_punica = False
+
+
+def get_punica_stamp(cxx_flags: List[str], nvcc_flags: List[str],
+                     cuda_version: Version) -> str:
+    """Hash the sources (by mtime and size) and flags of the punica kernels,
+    together with the torch and CUDA versions and the GPUs that
+    `-arch=native` resolves to, which all change the built library's ABI."""
+    files = [p for p in _CSRC_INDEX if p.startswith("csrc/punica/")]
+    stats = [os.stat(os.path.join(ROOT_DIR, p)) for p in files]
+    file_stats = [(p, st.st_mtime_ns, st.st_size)
+                  for p, st in zip(files, stats)]
+    native_archs = (sorted(set(_probe_capabilities()))
+                    if "-arch=native" in nvcc_flags else None)
+    key = repr((file_stats, cxx_flags, nvcc_flags, torch.__version__,
+                str(cuda_version), native_archs))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def is_punica_up_to_date(stamp: str) -> bool:
+    """Check whether the in-place punica library was built with `stamp`."""
+    if not any(Path(ROOT_DIR, "vllm").glob("_punica_C*.so")):
+        return False
+    try:
+        return Path(PUNICA_STAMP_PATH).read_text() == stamp
+    except FileNotFoundError:
+        return False
+
+
+_CAP_CACHE = None
+
+
+def _probe_capabilities() -> List[Tuple[int, int]]:
+    """Get the compute capabilities of all visible GPUs.
+
+    The CUDA driver is only queried on the first call; the result is reused
+    by every later caller.
+    """
+    global _CAP_CACHE
+    if _CAP_CACHE is None:
+        _CAP_CACHE = [
+            torch.cuda.get_device_capability(i)
+            for i in range(torch.cuda.device_count())
+        ]
+    return _CAP_CACHE
+
+
+if _is_hip():
+    rocm_arches = _ROCM_ARCH_PROBE.result()
     NVCC_FLAGS += ["--offload-arch=" + arch for arch in rocm_arches]
 else:
     # First, check the TORCH_CUDA_ARCH_LIST environment variable.
     compute_capabilities = get_torch_arch_list()
+    # Whether the target architectures were chosen explicitly by the user.
+    explicit_arch_list = bool(compute_capabilities)
 
 if _is_cuda() and not compute_capabilities:
     # If TORCH_CUDA_ARCH_LIST is not defined or empty, target all available
     # GPUs on the current machine.
-    device_count = torch.cuda.device_count()
-    for i in range(device_count):
-        major, minor = torch.cuda.get_device_capability(i)
+    for major, minor in _probe_capabilities():
         if major < 7:
             raise RuntimeError(
                 "GPUs with compute capability below 7.0 are not supported.")
@@ -234,7 +384,7 @@ if _is_cuda() and not compute_capabilities:
 ext_modules = []
 
 if _is_cuda():
-    nvcc_cuda_version = get_nvcc_cuda_version(CUDA_HOME)
+    nvcc_cuda_version = _COMPILER_VERSION_PROBE.result()
     if not compute_capabilities:
         # If no GPU is specified nor available, add all supported architectures
         # based on the NVCC CUDA version.
@@ -253,6 +403,13 @@ if _is_cuda():
         raise RuntimeError(
             "CUDA 11.1 or higher is required for compute capability 8.6.")
     if nvcc_cuda_version < Version("11.8"):
+        if (explicit_arch_list
+                and any(cc.startswith("8.9") for cc in compute_capabilities)):
+            # Build exactly what the user asked for.
+            raise RuntimeError(
+                "CUDA 11.8 or higher is required for compute capability 8.9. "
+                "Remove 8.9 from TORCH_CUDA_ARCH_LIST or use 8.0+PTX "
+                "instead.")
         if any(cc.startswith("8.9") for cc in compute_capabilities):
             # CUDA 11.8 is required to generate the code targeting compute capability 8.9.
             # However, GPUs with compute capability 8.9 can also run the code generated by
@@ -272,89 +429,164 @@ if _is_cuda():
 
     NVCC_FLAGS_PUNICA = NVCC_FLAGS.copy()
 
-    # Add target compute capabilities to NVCC flags.
-    for capability in compute_capabilities:
-        num = capability[0] + capability[2]
-        NVCC_FLAGS += ["-gencode", f"arch=compute_{num},code=sm_{num}"]
-        if capability.endswith("+PTX"):
-            NVCC_FLAGS += [
-                "-gencode", f"arch=compute_{num},code=compute_{num}"
-            ]
-        if int(capability[0]) >= 8:
-            NVCC_FLAGS_PUNICA += [
-                "-gencode", f"arch=compute_{num},code=sm_{num}"
-            ]
-            if capability.endswith("+PTX"):
-                NVCC_FLAGS_PUNICA += [
+    # Developer builds can target only the GPU of the build host, which
+    # skips the per-architecture SASS/PTX fan-out. Release wheels keep the
+    # full list of target architectures.
+    target_native = (bool(int(os.getenv("VLLM_TARGET_NATIVE", "0")))
+                     and not os.environ.get("VLLM_USE_PRECOMPILED"))
+    if target_native:
+        if nvcc_cuda_version < Version("11.6"):
+            raise RuntimeError(
+                "CUDA 11.6 or higher is required for VLLM_TARGET_NATIVE=1.")
+        NVCC_FLAGS += ["-arch=native"]
+        NVCC_FLAGS_PUNICA += ["-arch=native"]
+    else:
+        # PTX is only needed for forward compatibility with newer GPUs,
+        # which the PTX of the newest requested architecture already covers.
+        ptx_capability = max(
+            (cc for cc in compute_capabilities if cc.endswith("+PTX")),
+            key=lambda cc: tuple(map(int, cc[:-len("+PTX")].split("."))),
+            default=None)
+
+        # Add target compute capabilities to NVCC flags.
+        for capability in compute_capabilities:
+            num = capability[0] + capability[2]
+            NVCC_FLAGS += ["-gencode", f"arch=compute_{num},code=sm_{num}"]
+            if capability == ptx_capability:
+                NVCC_FLAGS += [
                     "-gencode", f"arch=compute_{num},code=compute_{num}"
                 ]
+            if int(capability[0]) >= 8:
+                NVCC_FLAGS_PUNICA += [
+                    "-gencode", f"arch=compute_{num},code=sm_{num}"
+                ]
+                if capability == ptx_capability:
+                    NVCC_FLAGS_PUNICA += [
+                        "-gencode", f"arch=compute_{num},code=compute_{num}"
+                    ]
+
+    # Optionally ship the attention kernels as PTX only. The driver
+    # JIT-compiles the PTX for the actual GPU when the extension is first
+    # loaded and keeps the result in its persistent compute cache (see
+    # CUDA_CACHE_PATH), trading a one-time JIT for a faster build and a
+    # smaller extension. The kernels select code paths on __CUDA_ARCH__ at
+    # PTX generation time, so this is only allowed for a single target
+    # architecture: PTX of an older one would run its fallbacks (or trap)
+    # on newer GPUs.
+    attention_ptx_only = (bool(int(os.getenv("VLLM_ATTENTION_PTX_ONLY",
+                                             "0"))) and not target_native)
+    if attention_ptx_only:
+        target_nums = set(cc[0] + cc[2] for cc in compute_capabilities)
+        if len(target_nums) == 1:
+            ptx_num = target_nums.pop()
+            attention_gencode_flags = [
+                "-gencode", f"arch=compute_{ptx_num},code=compute_{ptx_num}"
+            ]
+        else:
+            warnings.warn(
+                "VLLM_ATTENTION_PTX_ONLY=1 requires a single target "
+                "architecture in TORCH_CUDA_ARCH_LIST. Building SASS for the "
+                "attention kernels instead.",
+                stacklevel=2)
+            attention_ptx_only = False
 
-    # Use NVCC threads to parallelize the build.
+    # Use NVCC threads to parallelize the build. When MAX_JOBS is set, the
+    # cores are shared by the MAX_JOBS translation units that ninja compiles
+    # concurrently, and hyperthreads are not counted since ptxas is
+    # memory-bound.
     if nvcc_cuda_version >= Version("11.2"):
         nvcc_threads = int(os.getenv("NVCC_THREADS", 8))
-        num_threads = min(os.cpu_count(), nvcc_threads)
+        max_jobs = os.getenv("MAX_JOBS")
+        if max_jobs:
+            threads_per_job = max(
+                1, get_num_physical_cores() // max(1, int(max_jobs)))
+            num_threads = min(threads_per_job, nvcc_threads)
+            split_compile = threads_per_job // num_threads
+        else:
+            num_threads = min(os.cpu_count() or 1, nvcc_threads)
+            split_compile = 1
         NVCC_FLAGS += ["--threads", str(num_threads)]
+        if nvcc_cuda_version >= Version("12.0") and split_compile > 1:
+            # Give the remaining cores to the optimizer of each TU.
+            NVCC_FLAGS += ["--split-compile", str(split_compile)]
 
+    if nvcc_cuda_version >= Version("11.4"):
+        # Compress the device code embedded in the extensions.
+        NVCC_FLAGS += ["-Xfatbin=-compress-all"]
+
+    # Only the attention and cache kernels have an FP8 E5M2 KV cache path, so
+    # keep the extra template instantiations out of the other extensions.
     if nvcc_cuda_version >= Version("11.8"):
-        NVCC_FLAGS += ["-DENABLE_FP8_E5M2"]
-
-    # changes for punica kernels
-    NVCC_FLAGS += torch_cpp_ext.COMMON_NVCC_FLAGS
-    REMOVE_NVCC_FLAGS = [
-        '-D__CUDA_NO_HALF_OPERATORS__',
-        '-D__CUDA_NO_HALF_CONVERSIONS__',
-        '-D__CUDA_NO_BFLOAT16_CONVERSIONS__',
-        '-D__CUDA_NO_HALF2_OPERATORS__',
-    ]
-    for flag in REMOVE_NVCC_FLAGS:
-        with contextlib.suppress(ValueError):
-            torch_cpp_ext.COMMON_NVCC_FLAGS.remove(flag)
+        NVCC_FLAGS_FP8 = ["-DENABLE_FP8_E5M2"]
+
+    # The punica kernels need the half-precision operators.
+    NVCC_FLAGS_PUNICA += ["-include", PRELUDE_HEADER]
 
     install_punica = bool(int(os.getenv("VLLM_INSTALL_PUNICA_KERNELS", "0")))
-    device_count = torch.cuda.device_count()
-    for i in range(device_count):
-        major, minor = torch.cuda.get_device_capability(i)
-        if major < 8:
+    if explicit_arch_list:
+        # The target architectures are explicit (e.g. cross-compiling in CI),
+        # so do not touch the CUDA driver at all. NVCC_FLAGS_PUNICA only
+        # targets the sm80+ architectures, so one of them is enough.
+        if all(int(cc[0]) < 8 for cc in compute_capabilities):
             install_punica = False
-            break
+    elif any(major < 8 for major, _ in _probe_capabilities()):
+        install_punica = False
     if install_punica:
-        ext_modules.append(
-            CUDAExtension(
-                name="vllm._punica_C",
-                sources=["csrc/punica/punica_ops.cc"] +
-                glob("csrc/punica/bgmv/*.cu"),
-                extra_compile_args={
-                    "cxx": CXX_FLAGS,
-                    "nvcc": NVCC_FLAGS_PUNICA,
-                },
-            ))
+        PUNICA_STAMP = get_punica_stamp(CXX_FLAGS, NVCC_FLAGS_PUNICA,
+                                        nvcc_cuda_version)
+        if is_punica_up_to_date(PUNICA_STAMP):
+            # The in-place library was built from the same sources and flags.
+            reuse_punica = True
+        else:
+            ext_modules.append(
+                CUDAExtension(
+                    name="vllm._punica_C",
+                    sources=abs_sources(["csrc/punica/punica_ops.cc"] +
+                                        glob("csrc/punica/bgmv/*.cu")),
+                    include_dirs=[CSRC_DIR],
+                    extra_compile_args={
+                        "cxx": CXX_FLAGS,
+                        "nvcc": NVCC_FLAGS_PUNICA,
+                    },
+                ))
 elif _is_neuron():
     neuronxcc_version = get_neuronxcc_version()
 
-vllm_extension_sources = [
+# The custom kernels are split into several extensions so that they can be
+# compiled and linked in parallel (`python setup.py build_ext -j N`), and a
+# change in one kernel only relinks its own extension. `vllm/_C.py` merges
+# them back into a single `vllm._C` namespace.
+ATTN_SOURCES = [
     "csrc/cache_kernels.cu",
     "csrc/attention/attention_kernels.cu",
+    "csrc/pybind_attention.cpp",
+]
+QUANT_SOURCES = [
+    "csrc/quantization/squeezellm/quant_cuda_kernel.cu",
+    "csrc/quantization/gptq/q_gemm.cu",
+    "csrc/pybind_quantization.cpp",
+]
+MISC_SOURCES = [
     "csrc/pos_encoding_kernels.cu",
     "csrc/activation_kernels.cu",
     "csrc/layernorm_kernels.cu",
-    "csrc/quantization/squeezellm/quant_cuda_kernel.cu",
-    "csrc/quantization/gptq/q_gemm.cu",
     "csrc/cuda_utils_kernels.cu",
     "csrc/moe_align_block_size_kernels.cu",
-    "csrc/pybind.cpp",
+    "csrc/pybind_misc.cpp",
 ]
 
 if _is_cuda():
-    vllm_extension_sources.append("csrc/quantization/awq/gemm_kernels.cu")
-    vllm_extension_sources.append(
-        "csrc/quantization/marlin/marlin_cuda_kernel.cu")
-    vllm_extension_sources.append("csrc/custom_all_reduce.cu")
+    QUANT_SOURCES.append("csrc/quantization/awq/gemm_kernels.cu")
+    QUANT_SOURCES.append("csrc/quantization/marlin/marlin_cuda_kernel.cu")
+    MISC_SOURCES.append("csrc/custom_all_reduce.cu")
 
     # Add MoE kernels.
     ext_modules.append(
         CUDAExtension(
             name="vllm._moe_C",
-            sources=glob("csrc/moe/*.cu") + glob("csrc/moe/*.cpp"),
+            sources=abs_sources(
+                glob("csrc/moe/*.cu") + glob("csrc/moe/*.cpp")),
+            include_dirs=[CSRC_DIR],
             extra_compile_args={
                 "cxx": CXX_FLAGS,
                 "nvcc": NVCC_FLAGS,
@@ -362,58 +594,123 @@ if _is_cuda():
         ))
 
 if not _is_neuron():
-    vllm_extension = CUDAExtension(
-        name="vllm._C",
-        sources=vllm_extension_sources,
-        extra_compile_args={
-            "cxx": CXX_FLAGS,
-            "nvcc": NVCC_FLAGS,
-        },
-        libraries=["cuda"] if _is_cuda() else [],
-    )
-    ext_modules.append(vllm_extension)
+    NVCC_FLAGS_ATTN = NVCC_FLAGS + NVCC_FLAGS_FP8
+    if _is_cuda() and attention_ptx_only:
+        NVCC_FLAGS_ATTN = (strip_gencode_flags(NVCC_FLAGS_ATTN) +
+                           attention_gencode_flags)
+    for name, sources, nvcc_flags in [
+        ("vllm._C_attention", ATTN_SOURCES, NVCC_FLAGS_ATTN),
+        ("vllm._C_quantization", QUANT_SOURCES, NVCC_FLAGS),
+        ("vllm._C_misc", MISC_SOURCES, NVCC_FLAGS),
+    ]:
+        ext_modules.append(
+            CUDAExtension(
+                name=name,
+                sources=abs_sources(sources),
+                include_dirs=[CSRC_DIR],
+                extra_compile_args={
+                    "cxx": CXX_FLAGS,
+                    "nvcc": nvcc_flags,
+                },
+                libraries=["cuda"] if _is_cuda() else [],
+            ))
+
+
+def get_compiler_launcher() -> Optional[str]:
+    """Get the compiler cache (ccache or sccache) to launch compilers with.
+
+    Only enabled when VLLM_USE_CCACHE=1 and the launcher is found on PATH.
+    """
+    if not bool(int(os.getenv("VLLM_USE_CCACHE", "0"))):
+        return None
+    for launcher in ("ccache", "sccache"):
+        if shutil.which(launcher) is not None:
+            return launcher
+    warnings.warn(
+        "VLLM_USE_CCACHE=1 but neither ccache nor sccache is found on PATH. "
+        "Building without a compiler cache.",
+        stacklevel=2)
+    return None
+
+
+class CachedBuildExtension(BuildExtension):
+    """BuildExtension that runs the host and device compilers through a
+    compiler cache, similar to CMAKE_<LANG>_COMPILER_LAUNCHER, and records
+    the stamp of in-place punica builds."""
+
+    def build_extensions(self) -> None:
+        launcher = get_compiler_launcher()
+        write_ninja_file = torch_cpp_ext._write_ninja_file
+        if launcher is not None:
+            # Non-ninja builds invoke the host compiler directly.
+            self.compiler.compiler_so = ([launcher] +
+                                         self.compiler.compiler_so)
+            # Ninja builds take `cxx` and `nvcc` from the generated
+            # build.ninja, so prefix both variables there.
+            torch_cpp_ext._write_ninja_file = _with_compiler_launcher(
+                write_ninja_file, launcher)
+        try:
+            super().build_extensions()
+        finally:
+            torch_cpp_ext._write_ninja_file = write_ninja_file
+
+        # Only in-place builds leave the library where the next build looks
+        # for it, see is_punica_up_to_date().
+        built_punica = any(ext.name == "vllm._punica_C"
+                           for ext in self.extensions)
+        if built_punica and self.inplace:
+            os.makedirs(os.path.dirname(PUNICA_STAMP_PATH), exist_ok=True)
+            Path(PUNICA_STAMP_PATH).write_text(PUNICA_STAMP)
+
+
+def _with_compiler_launcher(write_ninja_file, launcher: str):
+
+    def _write_ninja_file(*args, **kwargs):
+        write_ninja_file(*args, **kwargs)
+        path = kwargs["path"] if "path" in kwargs else args[0]
+        with open(path) as f:
+            lines = f.readlines()
+        for i, line in enumerate(lines):
+            if line.startswith(("cxx = ", "nvcc = ")):
+                name, compiler = line.split(" = ", 1)
+                lines[i] = f"{name} = {launcher} {compiler}"
+        with open(path, "w") as f:
+            f.writelines(lines)
+
+    return _write_ninja_file
 
 
 def get_path(*filepath) -> str:
     return os.path.join(ROOT_DIR, *filepath)
 
 
+_VERSION_RE = re.compile(r"^__version__ = ['\"]([^'\"]*)['\"]", re.M)
+
+
+@functools.lru_cache(maxsize=None)
 def find_version(filepath: str) -> str:
     """Extract version information from the given filepath.
 
     Adapted from https://github.com/ray-project/ray/blob/0b190ee1160eeca9796bc091e07eaebf4c85b511/python/setup.py
     """
     with open(filepath) as fp:
-        version_match = re.search(r"^__version__ = ['\"]([^'\"]*)['\"]",
-                                  fp.read(), re.M)
+        version_match = _VERSION_RE.search(fp.read())
         if version_match:
             return version_match.group(1)
         raise RuntimeError("Unable to find version string.")
 
 
-def get_abi():
-    try:
-        command = "echo '#include <string>' | gcc -x c++ -E -dM - | fgrep _GLIBCXX_USE_CXX11_ABI" 
-        result = subprocess.run(command, shell=True, capture_output=True, text=True) 
-        output = result.stdout.strip() 
-        abi = "abi" + output.split(" ")[-1]
-        return abi
-    except Exception:
-        return 'abiUnknown'
+def get_abi() -> str:
+    # The extensions are compiled with the C++11 ABI setting of torch.
+    return f"abi{ABI}"
 
 
-def get_sha(root: Union[str, Path]) -> str:
-    try:
-        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root).decode('ascii').strip()
-    except Exception:
-        return 'Unknown'
-
 def get_version_add(sha: Optional[str] = None) -> str:
     vllm_root = os.path.dirname(os.path.abspath(__file__))
     add_version_path = os.path.join(os.path.join(vllm_root, "vllm"), "version.py")
     if sha != 'Unknown':
         if sha is None:
-            sha = get_sha(vllm_root)
+            sha = _SHA_PROBE.result()
         version = 'das1.1.git' + sha[:7]
 
     # abi version
@@ -431,26 +728,38 @@ def get_version_add(sha: Optional[str] = None) -> str:
     # torch version
     version += ".torch" + torch.__version__[:5]
 
-    with open(add_version_path, encoding="utf-8",mode="w") as file:
-        file.write("__version__='0.3.3'\n")
-        file.write("__dcu_version__='0.3.3+{}'\n".format(version))
-    file.close()
-    
-    
+    content = ("__version__='0.3.3'\n"
+               "__dcu_version__='0.3.3+{}'\n".format(version))
+    # Only rewrite the file when its content changes, so that its mtime (and
+    # thus any build cache depending on it) stays valid.
+    try:
+        old_content = Path(add_version_path).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        old_content = None
+    if old_content != content:
+        Path(add_version_path).write_text(content, encoding="utf-8")
+
+
+_DCU_VERSION_RE = re.compile(r"^__dcu_version__\s*=\s*['\"]([^'\"]*)['\"]",
+                             re.M)
+
+
 def get_version():
     get_version_add()
-    version_file = 'vllm/version.py'
-    with open(version_file, encoding='utf-8') as f:
-        exec(compile(f.read(), version_file, 'exec'))
-    return locals()['__dcu_version__']
+    with open(get_path("vllm", "version.py"), encoding='utf-8') as f:
+        version_match = _DCU_VERSION_RE.search(f.read())
+    if version_match is None:
+        raise RuntimeError("Unable to find DCU version string.")
+    return version_match.group(1)
 
 
+@functools.lru_cache(maxsize=None)
 def get_vllm_version() -> str:
     version = find_version(get_path("vllm", "__init__.py"))
 
     if _is_hip():
         # Get the HIP version
-        hipcc_version = get_hipcc_rocm_version()
+        hipcc_version = _COMPILER_VERSION_PROBE.result()
         if hipcc_version != MAIN_CUDA_VERSION:
             rocm_version_str = hipcc_version.replace(".", "")[:3]
         #     version += f"+rocm{rocm_version_str}"
@@ -470,6 +779,7 @@ def get_vllm_version() -> str:
     return version
 
 
+@functools.lru_cache(maxsize=None)
 def read_readme() -> str:
     """Read the README file if present."""
     p = get_path("README.md")
@@ -479,6 +789,7 @@ def read_readme() -> str:
         return ""
 
 
+@functools.lru_cache(maxsize=None)
 def get_requirements() -> List[str]:
     """Get Python package dependencies from requirements.txt."""
     if _is_hip():
@@ -499,6 +810,8 @@ package_data = {
 if os.environ.get("VLLM_USE_PRECOMPILED"):
     ext_modules = []
     package_data["vllm"].append("*.so")
+elif reuse_punica:
+    package_data["vllm"].append("_punica_C*.so")
 
 setuptools.setup(
     name="vllm",
@@ -527,6 +840,8 @@ setuptools.setup(
     python_requires=">=3.8",
     install_requires=get_requirements(),
     ext_modules=ext_modules,
-    cmdclass={"build_ext": BuildExtension} if not _is_neuron() else {},
+    cmdclass={
+        "build_ext": CachedBuildExtension.with_options(use_ninja=True)
+    } if not _is_neuron() else {},
     package_data=package_data,
 )
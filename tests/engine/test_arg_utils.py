@@ -0,0 +1,171 @@
+import argparse
+import dataclasses
+from types import SimpleNamespace
+
+import pytest
+
+from vllm.engine import arg_utils
+from vllm.engine.arg_utils import AsyncEngineArgs, EngineArgs
+
+# dest: (option strings, default, type, choices, action) of every option of
+# the hand-written AsyncEngineArgs parser the generated one replaces.
+LEGACY_OPTIONS = {
+    'model': (('--model', ), 'facebook/opt-125m', str, None, '_StoreAction'),
+    'tokenizer': (('--tokenizer', ), None, str, None, '_StoreAction'),
+    'revision': (('--revision', ), None, str, None, '_StoreAction'),
+    'code_revision': (('--code-revision', ), None, str, None,
+                      '_StoreAction'),
+    'tokenizer_revision': (('--tokenizer-revision', ), None, str, None,
+                           '_StoreAction'),
+    'tokenizer_mode': (('--tokenizer-mode', ), 'auto', str, ['auto', 'slow'],
+                       '_StoreAction'),
+    'trust_remote_code': (('--trust-remote-code', ), False, None, None,
+                          '_StoreTrueAction'),
+    'download_dir': (('--download-dir', ), None, str, None, '_StoreAction'),
+    'load_format': (('--load-format', ), 'auto', str,
+                    ['auto', 'pt', 'safetensors', 'npcache',
+                     'dummy'], '_StoreAction'),
+    'dtype': (('--dtype', ), 'auto', str,
+              ['auto', 'half', 'float16', 'bfloat16', 'float',
+               'float32'], '_StoreAction'),
+    'kv_cache_dtype': (('--kv-cache-dtype', ), 'auto', str,
+                       ['auto', 'fp8_e5m2', 'int8'], '_StoreAction'),
+    'kv_quant_params_path': (('--kv-quant-params-path', ), None, str, None,
+                             '_StoreAction'),
+    'max_model_len': (('--max-model-len', ), None, int, None,
+                      '_StoreAction'),
+    'worker_use_ray': (('--worker-use-ray', ), False, None, None,
+                       '_StoreTrueAction'),
+    'pipeline_parallel_size': (('--pipeline-parallel-size', '-pp'), 1, int,
+                               None, '_StoreAction'),
+    'tensor_parallel_size': (('--tensor-parallel-size', '-tp'), 1, int,
+                             None, '_StoreAction'),
+    'max_parallel_loading_workers': (('--max-parallel-loading-workers', ),
+                                     None, int, None, '_StoreAction'),
+    'block_size': (('--block-size', ), 16, int, [8, 16, 32,
+                                                 128], '_StoreAction'),
+    'seed': (('--seed', ), 0, int, None, '_StoreAction'),
+    'swap_space': (('--swap-space', ), 16, int, None, '_StoreAction'),
+    'gpu_memory_utilization': (('--gpu-memory-utilization', ), 0.9, float,
+                               None, '_StoreAction'),
+    'max_num_batched_tokens': (('--max-num-batched-tokens', ), None, int,
+                               None, '_StoreAction'),
+    'max_num_seqs': (('--max-num-seqs', ), 512, int, None, '_StoreAction'),
+    'max_paddings': (('--max-paddings', ), 128, int, None, '_StoreAction'),
+    'disable_log_stats': (('--disable-log-stats', ), False, None, None,
+                          '_StoreTrueAction'),
+    'quantization': (('--quantization', '-q'), None, str,
+                     ['awq', 'gptq', 'squeezellm', None], '_StoreAction'),
+    'enforce_eager': (('--enforce-eager', ), False, None, None,
+                      '_StoreTrueAction'),
+    'max_context_len_to_capture': (('--max-context-len-to-capture', ), 4096,
+                                   int, None, '_StoreAction'),
+    'disable_custom_all_reduce': (('--disable-custom-all-reduce', ), False,
+                                  None, None, '_StoreTrueAction'),
+    'enable_lora': (('--enable-lora', ), False, None, None,
+                    '_StoreTrueAction'),
+    'max_loras': (('--max-loras', ), 1, int, None, '_StoreAction'),
+    'max_lora_rank': (('--max-lora-rank', ), 16, int, None, '_StoreAction'),
+    'lora_extra_vocab_size': (('--lora-extra-vocab-size', ), 256, int, None,
+                              '_StoreAction'),
+    'lora_dtype': (('--lora-dtype', ), 'auto', str,
+                   ['auto', 'float16', 'bfloat16',
+                    'float32'], '_StoreAction'),
+    'max_cpu_loras': (('--max-cpu-loras', ), None, int, None,
+                      '_StoreAction'),
+    'device': (('--device', ), 'auto', str, ['auto', 'cuda',
+                                             'neuron'], '_StoreAction'),
+    'engine_use_ray': (('--engine-use-ray', ), False, None, None,
+                       '_StoreTrueAction'),
+    'disable_log_requests': (('--disable-log-requests', ), False, None, None,
+                             '_StoreTrueAction'),
+    'max_log_len': (('--max-log-len', ), None, int, None, '_StoreAction'),
+}
+
+
+def _options(parser: argparse.ArgumentParser):
+    return {
+        action.dest: (tuple(action.option_strings), action.default,
+                      action.type, action.choices, type(action).__name__)
+        for action in parser._actions if action.dest != 'help'
+    }
+
+
+def test_cli_args_match_legacy_parser():
+    parser = AsyncEngineArgs.add_cli_args(argparse.ArgumentParser())
+    assert _options(parser) == LEGACY_OPTIONS
+
+
+def test_cli_defaults_match_dataclass():
+    parser = EngineArgs.add_cli_args(argparse.ArgumentParser())
+    args = parser.parse_args([])
+    assert EngineArgs.from_cli_args(args) == EngineArgs(
+        model='facebook/opt-125m')
+    assert args.lora_dtype == 'auto'
+
+    args = parser.parse_args(['--lora-dtype', 'bfloat16', '-tp', '2'])
+    engine_args = EngineArgs.from_cli_args(args)
+    assert engine_args.lora_dtype == 'bfloat16'
+    assert engine_args.tensor_parallel_size == 2
+
+
+def test_missing_default_is_suppressed():
+
+    @dataclasses.dataclass
+    class Args:
+        required_field: str
+        optional_field: int = 3
+
+    parser = argparse.ArgumentParser()
+    arg_utils._add_field_args(parser, dataclasses.fields(Args), {
+        'required_field': dict(type=str),
+        'optional_field': dict(type=int),
+    })
+    args = parser.parse_args([])
+    assert not hasattr(args, 'required_field')
+    assert args.optional_field == 3
+    assert parser.parse_args(['--required-field',
+                              'x']).required_field == 'x'
+
+
+@pytest.fixture
+def fake_model_config(monkeypatch):
+    created = []
+
+    def _fake_model_config(*args):
+        created.append(args)
+        return SimpleNamespace(max_model_len=2048,
+                               get_sliding_window=lambda: None)
+
+    monkeypatch.setattr(arg_utils, 'ModelConfig', _fake_model_config)
+    arg_utils._create_model_config.cache_clear()
+    yield created
+    arg_utils._create_model_config.cache_clear()
+
+
+def test_lazy_configs_unpack_and_index(fake_model_config):
+    configs = EngineArgs(model='facebook/opt-125m',
+                         device='cuda').create_engine_configs()
+    assert not fake_model_config
+
+    model_config, cache_config, parallel_config, scheduler_config, \
+        device_config, lora_config = configs
+    assert len(configs) == 6
+    assert configs[0] is model_config
+    assert configs[-1] is lora_config is None
+    assert configs[1:3] == (cache_config, parallel_config)
+    assert tuple(configs) == (model_config, cache_config, parallel_config,
+                              scheduler_config, device_config, lora_config)
+    assert scheduler_config.max_model_len == 2048
+    assert device_config.device_type == 'cuda'
+
+
+def test_cached_model_config_is_not_shared(fake_model_config):
+    engine_args = EngineArgs(model='facebook/opt-125m', device='cuda')
+    first = engine_args.create_engine_configs().model_config
+    second = engine_args.create_engine_configs().model_config
+
+    assert len(fake_model_config) == 1
+    assert first is not second
+    first.max_model_len = 1
+    assert second.max_model_len == 2048
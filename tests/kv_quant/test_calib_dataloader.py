@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from vllm.kv_quant import calib_dataloader
+
+
+@pytest.fixture(autouse=True)
+def _calib_cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(calib_dataloader, '_CALIB_CACHE_DIR',
+                        str(tmp_path / 'calib'))
+
+
+class _CountingTokenizer:
+    name_or_path = 'counting'
+
+    def __init__(self):
+        self.calls = 0
+        self.encoded = []
+
+    def __call__(self, text, return_tensors=None):
+        self.calls += 1
+        if isinstance(text, list):
+            self.encoded += text
+            return {'input_ids': [[ord(c) for c in t] for t in text]}
+        ids = np.array([[ord(c) for c in text]], dtype=np.int32)
+        return type('Encoding', (), {'input_ids': ids})
+
+
+class _FakeSplit:
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def __len__(self):
+        return len(self.texts)
+
+    def select(self, indices):
+        return {'text': [self.texts[i] for i in indices]}
+
+
+@pytest.mark.parametrize('seqlen', [1, 16, 100])
+def test_sample_windows_bounds(seqlen):
+    input_ids = torch.arange(100)[None, :]
+    loader = calib_dataloader._sample_windows(input_ids, 32,
+                                              np.random.default_rng(0),
+                                              seqlen)
+
+    assert len(loader) == 32
+    assert loader.inps.shape == (32, 1, seqlen)
+    for inp in loader:
+        # Every window is a contiguous run of tokens inside the corpus.
+        assert inp.shape == (1, seqlen)
+        assert 0 <= inp[0, 0] and inp[0, -1] < 100
+        assert torch.equal(inp[0], torch.arange(inp[0, 0],
+                                                inp[0, 0] + seqlen))
+    assert (loader.tars[:, :, :-1] == -100).all()
+    assert torch.equal(loader.tars[:, :, -1], loader.inps[:, :, -1])
+
+
+def test_sample_windows_deterministic():
+    input_ids = torch.randint(0, 1000, (1, 500))
+    sample = [
+        calib_dataloader._sample_windows(input_ids, 8,
+                                         np.random.default_rng(seed), 32)
+        for seed in (1, 1, 2)
+    ]
+    assert torch.equal(sample[0].inps, sample[1].inps)
+    assert not torch.equal(sample[0].inps, sample[2].inps)
+
+
+def test_cached_tokenize_reuses_cache_file():
+    tokenizer = _CountingTokenizer()
+    first = calib_dataloader._cached_tokenize(tokenizer, 'hello world',
+                                              'wikitext2', 'train')
+    cache_files = os.listdir(calib_dataloader._CALIB_CACHE_DIR)
+    assert len(cache_files) == 1
+
+    second = calib_dataloader._cached_tokenize(tokenizer, 'hello world',
+                                               'wikitext2', 'train')
+    assert tokenizer.calls == 1
+    assert os.listdir(calib_dataloader._CALIB_CACHE_DIR) == cache_files
+    assert second.input_ids.dtype == torch.int64
+    assert torch.equal(first.input_ids, second.input_ids)
+    assert second.input_ids.tolist() == [[ord(c) for c in 'hello world']]
+
+    # Different text is a different cache entry.
+    calib_dataloader._cached_tokenize(tokenizer, 'other text', 'wikitext2',
+                                      'train')
+    assert tokenizer.calls == 2
+    assert len(os.listdir(calib_dataloader._CALIB_CACHE_DIR)) == 2
+
+
+def test_sample_documents_skips_short_documents():
+    texts = [chr(65 + i) * length for i, length in enumerate(range(1, 41))]
+    tokenizer = _CountingTokenizer()
+    windows = calib_dataloader._sample_documents(tokenizer,
+                                                 _FakeSplit(texts),
+                                                 8,
+                                                 16,
+                                                 np.random.default_rng(0),
+                                                 'c4',
+                                                 'train',
+                                                 batch_size=4)
+
+    assert windows.shape == (8, 16)
+    # Documents shorter than the window are never tokenized, and sampling
+    # stops once enough documents are found.
+    assert all(len(text) >= 16 for text in tokenizer.encoded)
+    assert len(tokenizer.encoded) < len(texts)
+    rows = {chr(row[0]) for row in windows.tolist()}
+    assert len(rows) == 8
+    for row in windows.tolist():
+        assert row == [row[0]] * 16
+
+    with pytest.raises(ValueError, match='have at least 32 tokens'):
+        calib_dataloader._sample_documents(_CountingTokenizer(),
+                                           _FakeSplit(texts), 10, 32,
+                                           np.random.default_rng(0), 'c4',
+                                           'train')
+
+
+def test_get_calib_loaders_unknown_name():
+    with pytest.raises(ValueError, match='Unsupported calibration dataset'):
+        calib_dataloader.get_calib_loaders('unknown', _CountingTokenizer())
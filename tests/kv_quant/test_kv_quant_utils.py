@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import torch
+
+from vllm.kv_quant.utils import load_stats, save_stats
+
+# More than ten layers, so that sorting the names would reorder them.
+NAMES = [f'model.layers.{i}' for i in range(12)]
+
+
+def _make_stats():
+    torch.manual_seed(0)
+    return {
+        stat: {name: torch.randn(4, 8).half()
+               for name in NAMES}
+        for stat in ('max', 'min', 'absmax')
+    }
+
+
+def test_stats_round_trip(tmp_path):
+    stats = _make_stats()
+    save_stats(stats, tmp_path / 'key_stats.safetensors')
+    loaded = load_stats(tmp_path / 'key_stats.safetensors')
+
+    assert list(loaded) == list(stats)
+    for stat, name2val in stats.items():
+        assert list(loaded[stat]) == NAMES
+        for name, val in name2val.items():
+            assert loaded[stat][name].dtype == val.dtype
+            assert torch.equal(loaded[stat][name], val)
+
+
+def test_export_loads_legacy_pth(tmp_path):
+    export_kv_params = pytest.importorskip('vllm.kv_quant.export_kv_params')
+    stats = _make_stats()
+    torch.save(stats, tmp_path / 'key_stats.pth')
+
+    loaded = export_kv_params._load_stats(tmp_path, 'key_stats')
+    assert list(loaded['absmax']) == NAMES
+    assert torch.equal(loaded['absmax']['model.layers.3'],
+                       stats['absmax']['model.layers.3'])
+
+    # The safetensors file takes precedence once it exists.
+    new_stats = {
+        stat: {name: val + 1
+               for name, val in name2val.items()}
+        for stat, name2val in stats.items()
+    }
+    save_stats(new_stats, tmp_path / 'key_stats.safetensors')
+    loaded = export_kv_params._load_stats(tmp_path, 'key_stats')
+    assert torch.equal(loaded['max']['model.layers.11'],
+                       new_stats['max']['model.layers.11'])
+
+
+def test_export_writes_axis_params(tmp_path):
+    export_kv_params = pytest.importorskip('vllm.kv_quant.export_kv_params')
+    torch.manual_seed(0)
+    # Per-channel key stats and per-token value stats of 4 heads of dim 8.
+    key_max = torch.rand(4, 8)
+    value_max = torch.rand(4, 1)
+    key_stats = {
+        'max': {
+            'model.layers.0': key_max
+        },
+        'min': {
+            'model.layers.0': -key_max
+        }
+    }
+    value_stats = {
+        'max': {
+            'model.layers.0': value_max
+        },
+        'min': {
+            'model.layers.0': -value_max
+        }
+    }
+
+    export_kv_params._export_asym(key_stats, value_stats, 8, tmp_path, tp=2)
+
+    for rank in range(2):
+        heads = slice(2 * rank, 2 * rank + 2)
+        scalars = np.fromfile(tmp_path /
+                              f'layers.0.past_kv_scale.{rank}.weight',
+                              dtype=np.float32)
+        assert scalars.shape == (4, )
+
+        k_params = np.fromfile(tmp_path /
+                               f'layers.0.past_k_scale.{rank}.weight',
+                               dtype=np.float32).reshape(2, 2, 8)
+        np.testing.assert_allclose(
+            k_params[0], (2 * key_max[heads] / 255).numpy(),
+            rtol=1e-6)
+        np.testing.assert_allclose(k_params[1], 0, atol=1e-6)
+        # The per-layer key scale is the largest per-channel one.
+        np.testing.assert_allclose(scalars[0], k_params[0].max(), rtol=1e-6)
+
+        v_params = np.fromfile(tmp_path /
+                               f'layers.0.past_v_scale.{rank}.weight',
+                               dtype=np.float32).reshape(2, 2, 1)
+        np.testing.assert_allclose(scalars[2], v_params[0].max(), rtol=1e-6)
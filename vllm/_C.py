@@ -0,0 +1,30 @@
+"""vLLM custom kernels.
+
+The kernels are built as separate extensions (attention, quantization and
+miscellaneous kernels) to speed up compiling and linking. This module merges
+them back into the `ops`, `cache_ops`, `cuda_utils` and `custom_ar`
+namespaces that the rest of vLLM imports from `vllm._C`.
+"""
+import types
+
+from vllm import _C_attention, _C_misc, _C_quantization
+
+
+def _merge_submodules(name: str, *submodules) -> types.ModuleType:
+    module = types.ModuleType(f"{__name__}.{name}")
+    for submodule in submodules:
+        module.__dict__.update({
+            key: value
+            for key, value in vars(submodule).items()
+            if not key.startswith("__")
+        })
+    return module
+
+
+ops = _merge_submodules("ops", _C_attention.ops, _C_quantization.ops,
+                        _C_misc.ops)
+cache_ops = _C_attention.cache_ops
+cuda_utils = _C_misc.cuda_utils
+# Custom all-reduce is only built for CUDA.
+if hasattr(_C_misc, "custom_ar"):
+    custom_ar = _C_misc.custom_ar
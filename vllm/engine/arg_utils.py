@@ -1,7 +1,9 @@
 import argparse
+import copy
 import dataclasses
+import functools
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, Optional, Union
 
 from vllm.config import (CacheConfig, DeviceConfig, ModelConfig,
                          ParallelConfig, SchedulerConfig, LoRAConfig)
@@ -43,7 +45,7 @@ class EngineArgs:
     max_loras: int = 1
     max_lora_rank: int = 16
     lora_extra_vocab_size: int = 256
-    lora_dtype = 'auto'
+    lora_dtype: str = 'auto'
     max_cpu_loras: Optional[int] = None
     device: str = 'auto'
 
@@ -55,227 +57,7 @@ class EngineArgs:
     def add_cli_args(
             parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
         """Shared CLI arguments for vLLM engine."""
-
-        # NOTE: If you update any of the arguments below, please also
-        # make sure to update docs/source/models/engine_args.rst
-
-        # Model arguments
-        parser.add_argument(
-            '--model',
-            type=str,
-            default='facebook/opt-125m',
-            help='name or path of the huggingface model to use')
-        parser.add_argument(
-            '--tokenizer',
-            type=str,
-            default=EngineArgs.tokenizer,
-            help='name or path of the huggingface tokenizer to use')
-        parser.add_argument(
-            '--revision',
-            type=str,
-            default=None,
-            help='the specific model version to use. It can be a branch '
-            'name, a tag name, or a commit id. If unspecified, will use '
-            'the default version.')
-        parser.add_argument(
-            '--code-revision',
-            type=str,
-            default=None,
-            help='the specific revision to use for the model code on '
-            'Hugging Face Hub. It can be a branch name, a tag name, or a '
-            'commit id. If unspecified, will use the default version.')
-        parser.add_argument(
-            '--tokenizer-revision',
-            type=str,
-            default=None,
-            help='the specific tokenizer version to use. It can be a branch '
-            'name, a tag name, or a commit id. If unspecified, will use '
-            'the default version.')
-        parser.add_argument('--tokenizer-mode',
-                            type=str,
-                            default=EngineArgs.tokenizer_mode,
-                            choices=['auto', 'slow'],
-                            help='tokenizer mode. "auto" will use the fast '
-                            'tokenizer if available, and "slow" will '
-                            'always use the slow tokenizer.')
-        parser.add_argument('--trust-remote-code',
-                            action='store_true',
-                            help='trust remote code from huggingface')
-        parser.add_argument('--download-dir',
-                            type=str,
-                            default=EngineArgs.download_dir,
-                            help='directory to download and load the weights, '
-                            'default to the default cache dir of '
-                            'huggingface')
-        parser.add_argument(
-            '--load-format',
-            type=str,
-            default=EngineArgs.load_format,
-            choices=['auto', 'pt', 'safetensors', 'npcache', 'dummy'],
-            help='The format of the model weights to load. '
-            '"auto" will try to load the weights in the safetensors format '
-            'and fall back to the pytorch bin format if safetensors format '
-            'is not available. '
-            '"pt" will load the weights in the pytorch bin format. '
-            '"safetensors" will load the weights in the safetensors format. '
-            '"npcache" will load the weights in pytorch format and store '
-            'a numpy cache to speed up the loading. '
-            '"dummy" will initialize the weights with random values, '
-            'which is mainly for profiling.')
-        parser.add_argument(
-            '--dtype',
-            type=str,
-            default=EngineArgs.dtype,
-            choices=[
-                'auto', 'half', 'float16', 'bfloat16', 'float', 'float32'
-            ],
-            help='data type for model weights and activations. '
-            'The "auto" option will use FP16 precision '
-            'for FP32 and FP16 models, and BF16 precision '
-            'for BF16 models.')
-        parser.add_argument(
-            '--kv-cache-dtype',
-            type=str,
-            choices=['auto', 'fp8_e5m2', 'int8'],
-            default=EngineArgs.kv_cache_dtype,
-            help='Data type for kv cache storage. If "auto", will use model '
-            'data type. Note FP8 is not supported when cuda version is '
-            'lower than 11.8.')
-        parser.add_argument(
-            '--kv-quant-params-path',
-            type=str,
-            default=EngineArgs.kv_quant_params_path,
-            help='Path to scales and zero points of kv cache quantizaiton '
-            'when kv cache dtype is int8.')
-        parser.add_argument('--max-model-len',
-                            type=int,
-                            default=EngineArgs.max_model_len,
-                            help='model context length. If unspecified, '
-                            'will be automatically derived from the model.')
-        # Parallel arguments
-        parser.add_argument('--worker-use-ray',
-                            action='store_true',
-                            help='use Ray for distributed serving, will be '
-                            'automatically set when using more than 1 GPU')
-        parser.add_argument('--pipeline-parallel-size',
-                            '-pp',
-                            type=int,
-                            default=EngineArgs.pipeline_parallel_size,
-                            help='number of pipeline stages')
-        parser.add_argument('--tensor-parallel-size',
-                            '-tp',
-                            type=int,
-                            default=EngineArgs.tensor_parallel_size,
-                            help='number of tensor parallel replicas')
-        parser.add_argument(
-            '--max-parallel-loading-workers',
-            type=int,
-            default=EngineArgs.max_parallel_loading_workers,
-            help='load model sequentially in multiple batches, '
-            'to avoid RAM OOM when using tensor '
-            'parallel and large models')
-        # KV cache arguments
-        parser.add_argument('--block-size',
-                            type=int,
-                            default=EngineArgs.block_size,
-                            choices=[8, 16, 32, 128],
-                            help='token block size')
-        parser.add_argument('--seed',
-                            type=int,
-                            default=EngineArgs.seed,
-                            help='random seed')
-        parser.add_argument('--swap-space',
-                            type=int,
-                            default=EngineArgs.swap_space,
-                            help='CPU swap space size (GiB) per GPU')
-        parser.add_argument(
-            '--gpu-memory-utilization',
-            type=float,
-            default=EngineArgs.gpu_memory_utilization,
-            help='the fraction of GPU memory to be used for '
-            'the model executor, which can range from 0 to 1.'
-            'If unspecified, will use the default value of 0.9.')
-        parser.add_argument('--max-num-batched-tokens',
-                            type=int,
-                            default=EngineArgs.max_num_batched_tokens,
-                            help='maximum number of batched tokens per '
-                            'iteration')
-        parser.add_argument('--max-num-seqs',
-                            type=int,
-                            default=EngineArgs.max_num_seqs,
-                            help='maximum number of sequences per iteration')
-        parser.add_argument('--max-paddings',
-                            type=int,
-                            default=EngineArgs.max_paddings,
-                            help='maximum number of paddings in a batch')
-        parser.add_argument('--disable-log-stats',
-                            action='store_true',
-                            help='disable logging statistics')
-        # Quantization settings.
-        parser.add_argument('--quantization',
-                            '-q',
-                            type=str,
-                            choices=['awq', 'gptq', 'squeezellm', None],
-                            default=EngineArgs.quantization,
-                            help='Method used to quantize the weights. If '
-                            'None, we first check the `quantization_config` '
-                            'attribute in the model config file. If that is '
-                            'None, we assume the model weights are not '
-                            'quantized and use `dtype` to determine the data '
-                            'type of the weights.')
-        parser.add_argument('--enforce-eager',
-                            action='store_true',
-                            help='Always use eager-mode PyTorch. If False, '
-                            'will use eager mode and CUDA graph in hybrid '
-                            'for maximal performance and flexibility.')
-        parser.add_argument('--max-context-len-to-capture',
-                            type=int,
-                            default=EngineArgs.max_context_len_to_capture,
-                            help='maximum context length covered by CUDA '
-                            'graphs. When a sequence has context length '
-                            'larger than this, we fall back to eager mode.')
-        parser.add_argument('--disable-custom-all-reduce',
-                            action='store_true',
-                            default=EngineArgs.disable_custom_all_reduce,
-                            help='See ParallelConfig')
-        # LoRA related configs
-        parser.add_argument('--enable-lora',
-                            action='store_true',
-                            help='If True, enable handling of LoRA adapters.')
-        parser.add_argument('--max-loras',
-                            type=int,
-                            default=EngineArgs.max_loras,
-                            help='Max number of LoRAs in a single batch.')
-        parser.add_argument('--max-lora-rank',
-                            type=int,
-                            default=EngineArgs.max_lora_rank,
-                            help='Max LoRA rank.')
-        parser.add_argument(
-            '--lora-extra-vocab-size',
-            type=int,
-            default=EngineArgs.lora_extra_vocab_size,
-            help=('Maximum size of extra vocabulary that can be '
-                  'present in a LoRA adapter (added to the base '
-                  'model vocabulary).'))
-        parser.add_argument(
-            '--lora-dtype',
-            type=str,
-            default=EngineArgs.lora_dtype,
-            choices=['auto', 'float16', 'bfloat16', 'float32'],
-            help=('Data type for LoRA. If auto, will default to '
-                  'base model dtype.'))
-        parser.add_argument(
-            '--max-cpu-loras',
-            type=int,
-            default=EngineArgs.max_cpu_loras,
-            help=('Maximum number of LoRAs to store in CPU memory. '
-                  'Must be >= than max_num_seqs. '
-                  'Defaults to max_num_seqs.'))
-        parser.add_argument("--device",
-                            type=str,
-                            default=EngineArgs.device,
-                            choices=["auto", "cuda", "neuron"],
-                            help='Device type for vLLM execution.')
+        _add_field_args(parser, dataclasses.fields(EngineArgs), _FIELD_META)
         return parser
 
     @classmethod
@@ -286,40 +68,296 @@ class EngineArgs:
         engine_args = cls(**{attr: getattr(args, attr) for attr in attrs})
         return engine_args
 
-    def create_engine_configs(
-        self,
-    ) -> Tuple[ModelConfig, CacheConfig, ParallelConfig, SchedulerConfig,
-               DeviceConfig, Optional[LoRAConfig]]:
-        device_config = DeviceConfig(self.device)
-        model_config = ModelConfig(
-            self.model, self.tokenizer, self.tokenizer_mode,
-            self.trust_remote_code, self.download_dir, self.load_format,
-            self.dtype, self.seed, self.revision, self.code_revision,
-            self.tokenizer_revision, self.max_model_len, self.quantization,
-            self.enforce_eager, self.max_context_len_to_capture)
-        cache_config = CacheConfig(self.block_size,
-                                   self.gpu_memory_utilization,
-                                   self.swap_space, self.kv_cache_dtype,
-                                   self.kv_quant_params_path,
-                                   model_config.get_sliding_window())
-        parallel_config = ParallelConfig(self.pipeline_parallel_size,
-                                         self.tensor_parallel_size,
-                                         self.worker_use_ray,
-                                         self.max_parallel_loading_workers,
-                                         self.disable_custom_all_reduce)
-        scheduler_config = SchedulerConfig(self.max_num_batched_tokens,
-                                           self.max_num_seqs,
-                                           model_config.max_model_len,
-                                           self.max_paddings)
-        lora_config = LoRAConfig(
-            max_lora_rank=self.max_lora_rank,
-            max_loras=self.max_loras,
-            lora_extra_vocab_size=self.lora_extra_vocab_size,
-            lora_dtype=self.lora_dtype,
-            max_cpu_loras=self.max_cpu_loras if self.max_cpu_loras
-            and self.max_cpu_loras > 0 else None) if self.enable_lora else None
-        return (model_config, cache_config, parallel_config, scheduler_config,
-                device_config, lora_config)
+    def create_engine_configs(self) -> "_LazyConfigs":
+        """Create the engine configs.
+
+        The configs are built on first access, so callers that only need,
+        e.g., the parallel config do not load the HuggingFace model config.
+        The result unpacks like the (model, cache, parallel, scheduler,
+        device, lora) config tuple.
+        """
+        return _LazyConfigs(self)
+
+
+# NOTE: If you update any of the arguments below, please also
+# make sure to update docs/source/models/engine_args.rst
+_FIELD_META = {
+    # Model arguments
+    'model': dict(
+        type=str,
+        default='facebook/opt-125m',
+        help='name or path of the huggingface model to use'),
+    'tokenizer': dict(
+        type=str,
+        help='name or path of the huggingface tokenizer to use'),
+    'revision': dict(
+        type=str,
+        help='the specific model version to use. It can be a branch '
+        'name, a tag name, or a commit id. If unspecified, will use '
+        'the default version.'),
+    'code_revision': dict(
+        type=str,
+        help='the specific revision to use for the model code on '
+        'Hugging Face Hub. It can be a branch name, a tag name, or a '
+        'commit id. If unspecified, will use the default version.'),
+    'tokenizer_revision': dict(
+        type=str,
+        help='the specific tokenizer version to use. It can be a branch '
+        'name, a tag name, or a commit id. If unspecified, will use '
+        'the default version.'),
+    'tokenizer_mode': dict(
+        type=str,
+        choices=['auto', 'slow'],
+        help='tokenizer mode. "auto" will use the fast '
+        'tokenizer if available, and "slow" will '
+        'always use the slow tokenizer.'),
+    'trust_remote_code': dict(
+        action='store_true',
+        help='trust remote code from huggingface'),
+    'download_dir': dict(
+        type=str,
+        help='directory to download and load the weights, '
+        'default to the default cache dir of '
+        'huggingface'),
+    'load_format': dict(
+        type=str,
+        choices=['auto', 'pt', 'safetensors', 'npcache', 'dummy'],
+        help='The format of the model weights to load. '
+        '"auto" will try to load the weights in the safetensors format '
+        'and fall back to the pytorch bin format if safetensors format '
+        'is not available. '
+        '"pt" will load the weights in the pytorch bin format. '
+        '"safetensors" will load the weights in the safetensors format. '
+        '"npcache" will load the weights in pytorch format and store '
+        'a numpy cache to speed up the loading. '
+        '"dummy" will initialize the weights with random values, '
+        'which is mainly for profiling.'),
+    'dtype': dict(
+        type=str,
+        choices=['auto', 'half', 'float16', 'bfloat16', 'float', 'float32'],
+        help='data type for model weights and activations. '
+        'The "auto" option will use FP16 precision '
+        'for FP32 and FP16 models, and BF16 precision '
+        'for BF16 models.'),
+    'kv_cache_dtype': dict(
+        type=str,
+        choices=['auto', 'fp8_e5m2', 'int8'],
+        help='Data type for kv cache storage. If "auto", will use model '
+        'data type. Note FP8 is not supported when cuda version is '
+        'lower than 11.8.'),
+    'kv_quant_params_path': dict(
+        type=str,
+        help='Path to scales and zero points of kv cache quantizaiton '
+        'when kv cache dtype is int8.'),
+    'max_model_len': dict(
+        type=int,
+        help='model context length. If unspecified, '
+        'will be automatically derived from the model.'),
+    # Parallel arguments
+    'worker_use_ray': dict(
+        action='store_true',
+        help='use Ray for distributed serving, will be '
+        'automatically set when using more than 1 GPU'),
+    'pipeline_parallel_size': dict(
+        type=int,
+        help='number of pipeline stages'),
+    'tensor_parallel_size': dict(
+        type=int,
+        help='number of tensor parallel replicas'),
+    'max_parallel_loading_workers': dict(
+        type=int,
+        help='load model sequentially in multiple batches, '
+        'to avoid RAM OOM when using tensor '
+        'parallel and large models'),
+    # KV cache arguments
+    'block_size': dict(
+        type=int,
+        choices=[8, 16, 32, 128],
+        help='token block size'),
+    'seed': dict(
+        type=int,
+        help='random seed'),
+    'swap_space': dict(
+        type=int,
+        help='CPU swap space size (GiB) per GPU'),
+    'gpu_memory_utilization': dict(
+        type=float,
+        help='the fraction of GPU memory to be used for '
+        'the model executor, which can range from 0 to 1.'
+        'If unspecified, will use the default value of 0.9.'),
+    'max_num_batched_tokens': dict(
+        type=int,
+        help='maximum number of batched tokens per '
+        'iteration'),
+    'max_num_seqs': dict(
+        type=int,
+        help='maximum number of sequences per iteration'),
+    'max_paddings': dict(
+        type=int,
+        help='maximum number of paddings in a batch'),
+    'disable_log_stats': dict(
+        action='store_true',
+        help='disable logging statistics'),
+    # Quantization settings.
+    'quantization': dict(
+        type=str,
+        choices=['awq', 'gptq', 'squeezellm', None],
+        help='Method used to quantize the weights. If '
+        'None, we first check the `quantization_config` '
+        'attribute in the model config file. If that is '
+        'None, we assume the model weights are not '
+        'quantized and use `dtype` to determine the data '
+        'type of the weights.'),
+    'enforce_eager': dict(
+        action='store_true',
+        help='Always use eager-mode PyTorch. If False, '
+        'will use eager mode and CUDA graph in hybrid '
+        'for maximal performance and flexibility.'),
+    'max_context_len_to_capture': dict(
+        type=int,
+        help='maximum context length covered by CUDA '
+        'graphs. When a sequence has context length '
+        'larger than this, we fall back to eager mode.'),
+    'disable_custom_all_reduce': dict(
+        action='store_true',
+        help='See ParallelConfig'),
+    # LoRA related configs
+    'enable_lora': dict(
+        action='store_true',
+        help='If True, enable handling of LoRA adapters.'),
+    'max_loras': dict(
+        type=int,
+        help='Max number of LoRAs in a single batch.'),
+    'max_lora_rank': dict(
+        type=int,
+        help='Max LoRA rank.'),
+    'lora_extra_vocab_size': dict(
+        type=int,
+        help='Maximum size of extra vocabulary that can be '
+        'present in a LoRA adapter (added to the base '
+        'model vocabulary).'),
+    'lora_dtype': dict(
+        type=str,
+        choices=['auto', 'float16', 'bfloat16', 'float32'],
+        help='Data type for LoRA. If auto, will default to '
+        'base model dtype.'),
+    'max_cpu_loras': dict(
+        type=int,
+        help='Maximum number of LoRAs to store in CPU memory. '
+        'Must be >= than max_num_seqs. '
+        'Defaults to max_num_seqs.'),
+    'device': dict(
+        type=str,
+        choices=["auto", "cuda", "neuron"],
+        help='Device type for vLLM execution.'),
+}
+_SHORT_FLAGS = {
+    'pipeline_parallel_size': ('-pp', ),
+    'tensor_parallel_size': ('-tp', ),
+    'quantization': ('-q', ),
+}
+
+
+def _add_field_args(parser: argparse.ArgumentParser,
+                    fields: Iterable[dataclasses.Field],
+                    field_meta: Dict[str, Dict[str, Any]]) -> None:
+    """Register one `--field-name` option per dataclass field, defaulting to
+    the field's default unless `field_meta` overrides it."""
+    for field in fields:
+        flags = (f'--{field.name.replace("_", "-")}',
+                 ) + _SHORT_FLAGS.get(field.name, ())
+        kwargs = dict(field_meta[field.name])
+        if 'default' not in kwargs:
+            kwargs['default'] = (argparse.SUPPRESS if field.default is
+                                 dataclasses.MISSING else field.default)
+        parser.add_argument(*flags, **kwargs)
+
+
+@functools.lru_cache(maxsize=30)
+def _create_model_config(*args: Any) -> ModelConfig:
+    return ModelConfig(*args)
+
+
+class _LazyConfigs:
+    """Engine configs that are built on first access.
+
+    Iterating, indexing or unpacking yields the configs in the order of the
+    tuple previously returned by `EngineArgs.create_engine_configs`.
+    """
+
+    _FIELDS = ('model_config', 'cache_config', 'parallel_config',
+               'scheduler_config', 'device_config', 'lora_config')
+
+    def __init__(self, engine_args: EngineArgs) -> None:
+        self._args = engine_args
+
+    @functools.cached_property
+    def model_config(self) -> ModelConfig:
+        # Building the model config loads and validates the HuggingFace
+        # config, so it is done once per distinct set of arguments. The
+        # engine mutates its configs, so every caller gets its own copy.
+        args = self._args
+        return copy.deepcopy(
+            _create_model_config(args.model, args.tokenizer,
+                                 args.tokenizer_mode, args.trust_remote_code,
+                                 args.download_dir, args.load_format,
+                                 args.dtype, args.seed, args.revision,
+                                 args.code_revision, args.tokenizer_revision,
+                                 args.max_model_len, args.quantization,
+                                 args.enforce_eager,
+                                 args.max_context_len_to_capture))
+
+    @functools.cached_property
+    def cache_config(self) -> CacheConfig:
+        args = self._args
+        return CacheConfig(args.block_size, args.gpu_memory_utilization,
+                           args.swap_space, args.kv_cache_dtype,
+                           args.kv_quant_params_path,
+                           self.model_config.get_sliding_window())
+
+    @functools.cached_property
+    def parallel_config(self) -> ParallelConfig:
+        args = self._args
+        return ParallelConfig(args.pipeline_parallel_size,
+                              args.tensor_parallel_size, args.worker_use_ray,
+                              args.max_parallel_loading_workers,
+                              args.disable_custom_all_reduce)
+
+    @functools.cached_property
+    def scheduler_config(self) -> SchedulerConfig:
+        args = self._args
+        return SchedulerConfig(args.max_num_batched_tokens,
+                               args.max_num_seqs,
+                               self.model_config.max_model_len,
+                               args.max_paddings)
+
+    @functools.cached_property
+    def device_config(self) -> DeviceConfig:
+        return DeviceConfig(self._args.device)
+
+    @functools.cached_property
+    def lora_config(self) -> Optional[LoRAConfig]:
+        args = self._args
+        if not args.enable_lora:
+            return None
+        return LoRAConfig(
+            max_lora_rank=args.max_lora_rank,
+            max_loras=args.max_loras,
+            lora_extra_vocab_size=args.lora_extra_vocab_size,
+            lora_dtype=args.lora_dtype,
+            max_cpu_loras=args.max_cpu_loras if args.max_cpu_loras
+            and args.max_cpu_loras > 0 else None)
+
+    def __iter__(self) -> Iterator[Any]:
+        return (getattr(self, name) for name in self._FIELDS)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return tuple(getattr(self, name) for name in self._FIELDS[index])
+        return getattr(self, self._FIELDS[index])
+
+    def __len__(self) -> int:
+        return len(self._FIELDS)
 
 
 @dataclass
@@ -333,17 +371,24 @@ class AsyncEngineArgs(EngineArgs):
     def add_cli_args(
             parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
         parser = EngineArgs.add_cli_args(parser)
-        parser.add_argument('--engine-use-ray',
-                            action='store_true',
-                            help='use Ray to start the LLM engine in a '
-                            'separate process as the server process.')
-        parser.add_argument('--disable-log-requests',
-                            action='store_true',
-                            help='disable logging requests')
-        parser.add_argument('--max-log-len',
-                            type=int,
-                            default=None,
-                            help='max number of prompt characters or prompt '
-                            'ID numbers being printed in log. '
-                            'Default: unlimited.')
+        _add_field_args(parser, [
+            field for field in dataclasses.fields(AsyncEngineArgs)
+            if field.name in _ASYNC_FIELD_META
+        ], _ASYNC_FIELD_META)
         return parser
+
+
+_ASYNC_FIELD_META = {
+    'engine_use_ray': dict(
+        action='store_true',
+        help='use Ray to start the LLM engine in a '
+        'separate process as the server process.'),
+    'disable_log_requests': dict(
+        action='store_true',
+        help='disable logging requests'),
+    'max_log_len': dict(
+        type=int,
+        help='max number of prompt characters or prompt '
+        'ID numbers being printed in log. '
+        'Default: unlimited.'),
+}
@@ -1,11 +1,165 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+# NOTE: `datasets` and `torch` are imported inside the functions that use
+# them so that importing this module stays cheap when no calibration data is
+# loaded.
+import hashlib
+import os
+
 import numpy as np
-import torch
+
+_CALIB_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'vllm',
+                                'calib')
+
+
+class TokenizerWrapper:
+
+    def __init__(self, input_ids):
+        self.input_ids = input_ids
+
+
+class CalibLoader:
+    """Calibration samples stacked into one (nsamples, 1, seqlen) tensor.
+
+    Indexing and iterating always give the input tensors of shape
+    (1, seqlen), so consumers need not tell samples with and without targets
+    apart; the targets stay available through `tars`. If `device` is set,
+    the inputs are pinned once and every item is copied to it asynchronously.
+    """
+
+    def __init__(self, inps, tars=None, device=None):
+        self.inps = inps
+        self.tars = tars
+        self.device = device
+
+    def __len__(self):
+        return self.inps.shape[0]
+
+    def __getitem__(self, index):
+        return self.inps[index]
+
+    def __iter__(self):
+        if self.device is None:
+            yield from self.inps
+            return
+        import torch
+        pinned = torch.device(self.device).type == 'cuda'
+        inps = self.inps.pin_memory() if pinned else self.inps
+        for inp in inps:
+            yield inp.to(self.device, non_blocking=pinned)
+
+
+def _calib_cache_file(tokenizer, dataset, split, content):
+    """Path of the on-disk cache entry for `content` of a dataset split
+    encoded by `tokenizer`."""
+    key = hashlib.sha256()
+    for part in (tokenizer.__class__.__name__,
+                 getattr(tokenizer, 'name_or_path', ''), dataset, split):
+        key.update(str(part).encode())
+        key.update(b'\0')
+    key.update(str(content).encode())
+    return os.path.join(_CALIB_CACHE_DIR,
+                        f'{dataset}-{split}-{key.hexdigest()[:16]}.npy')
+
+
+def _save_cache_file(cache_file, array):
+    os.makedirs(_CALIB_CACHE_DIR, exist_ok=True)
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp.npy'
+    np.save(tmp_file, array)
+    os.replace(tmp_file, cache_file)
+
+
+def _cached_tokenize(tokenizer, text, dataset, split):
+    """Tokenize a whole corpus split, caching the token ids on disk.
+
+    The ids are stored with `np.save` under `~/.cache/vllm/calib/`, keyed by
+    the tokenizer, the dataset split and the text itself, and memory-mapped
+    on later calls instead of being re-encoded.
+    Returns:
+        TokenizerWrapper whose `input_ids` has shape (1, num_tokens).
+    """
+    import torch
+    cache_file = _calib_cache_file(tokenizer, dataset, split, text)
+    if not os.path.exists(cache_file):
+        input_ids = tokenizer(text, return_tensors='np').input_ids
+        _save_cache_file(cache_file, input_ids.astype(np.int64))
+    # Copy-on-write keeps the tensor writable while only touching the pages
+    # that are actually sliced.
+    input_ids = np.load(cache_file, mmap_mode='c')
+    return TokenizerWrapper(torch.from_numpy(input_ids))
+
+
+def _sample_documents(tokenizer,
+                      data,
+                      nsamples,
+                      seqlen,
+                      rng,
+                      dataset,
+                      split,
+                      batch_size=1000):
+    """Sample `nsamples` windows of `seqlen` tokens, each from a distinct
+    random document that is at least `seqlen` tokens long.
+
+    Documents are visited in random order, `batch_size` at a time, until
+    enough long ones are found. Almost every token spans at least one
+    character, so documents shorter than `seqlen` characters are skipped
+    without being tokenized and only the rest are encoded to confirm their
+    length.
+    Returns:
+        Tensor of shape (nsamples, seqlen).
+    """
+    import torch
+    order = rng.permutation(len(data))
+    windows = torch.empty((nsamples, seqlen), dtype=torch.int64)
+    n = 0
+    for start in range(0, len(order), batch_size):
+        texts = data.select(order[start:start + batch_size])['text']
+        texts = [text for text in texts if len(text) >= seqlen]
+        if not texts:
+            continue
+        for input_ids in tokenizer(texts)['input_ids']:
+            if len(input_ids) < seqlen:
+                continue
+            i = rng.integers(0, len(input_ids) - seqlen, endpoint=True)
+            windows[n] = torch.tensor(input_ids[i:i + seqlen])
+            n += 1
+            if n == nsamples:
+                return windows
+    raise ValueError(f'Only {n} documents in {dataset}/{split} have at least '
+                     f'{seqlen} tokens, {nsamples} are needed.')
+
+
+def _sample_windows(input_ids, nsamples, rng, seqlen):
+    """Sample `nsamples` random windows of `seqlen` tokens from a (1, N)
+    token tensor in one gather.
+    Returns:
+        CalibLoader of inputs of shape (1, seqlen), whose targets mask all
+        but the last token with -100.
+    """
+    import torch
+    starts = torch.from_numpy(
+        rng.integers(0, input_ids.shape[1] - seqlen, nsamples, endpoint=True))
+    idx = starts[:, None] + torch.arange(seqlen)[None, :]
+    return _to_trainloader(input_ids[0][idx])
+
+
+def _to_trainloader(inp):
+    """Pair each row of an (nsamples, seqlen) tensor with its target, which
+    masks all but the last token with -100.
+    Returns:
+        CalibLoader of inputs of shape (1, seqlen) with those targets.
+    """
+    import torch
+    tar = torch.full_like(inp, -100)
+    tar[:, -1] = inp[:, -1]
+    return CalibLoader(inp.unsqueeze(1), tar.unsqueeze(1))
 
 
 def set_seed(seed):
-    np.random.seed(seed)
+    """Seed torch and return the `np.random.Generator` that the loaders
+    sample from."""
+    import torch
     torch.random.manual_seed(seed)
+    return np.random.default_rng(seed)
 
 
 def get_wikitext2(tokenizer, nsamples, seed, seqlen, path=None):
@@ -13,10 +167,11 @@ def get_wikitext2(tokenizer, nsamples, seed, seqlen, path=None):
     Args:
         tokenizer: Tokenizer to encode text.
         nsamples: Number of samples to take from train set.
-        seed: Random seed for sampling.
+        seed: Random seed or `np.random.Generator` for sampling.
         seqlen: Maximum sequence length.
     Returns:
-        train_loader: List of sampled and tokenized training examples.
+        train_loader: CalibLoader of sampled and tokenized training examples,
+        iterating over the (1, seqlen) input tensors.
         test_enc: Full tokenized Wikitext-2 test set.
     """
     from datasets import load_dataset
@@ -27,53 +182,44 @@ def get_wikitext2(tokenizer, nsamples, seed, seqlen, path=None):
                             'wikitext-2-raw-v1',
                             split='test')
 
-    trainenc = tokenizer('\n\n'.join(traindata['text']), return_tensors='pt')
-    testenc = tokenizer('\n\n'.join(testdata['text']), return_tensors='pt')
-
-    import random
-    random.seed(seed)
-    trainloader = []
-    for _ in range(nsamples):
-        i = random.randint(0, trainenc.input_ids.shape[1] - seqlen)
-        j = i + seqlen
-        inp = trainenc.input_ids[:, i:j]
-        tar = inp.clone()
-        tar[:, :-1] = -100
-        trainloader.append((inp, tar))
+    trainenc = _cached_tokenize(tokenizer, '\n\n'.join(traindata['text']),
+                                'wikitext2', 'train')
+    testenc = _cached_tokenize(tokenizer, '\n\n'.join(testdata['text']),
+                               'wikitext2', 'test')
+
+    trainloader = _sample_windows(trainenc.input_ids, nsamples,
+                                  np.random.default_rng(seed), seqlen)
     return trainloader, testenc
 
 
-def get_ptb(tokenizer, nsamples, seed, seqlen):
+def get_ptb(tokenizer, nsamples, seed, seqlen, path=None):
     """Load PTB train and validation datasets and tokenize.
     Args:
         tokenizer: Tokenizer to encode text.
         nsamples: Number of samples to take from train set.
-        seed: Random seed for sampling.
+        seed: Random seed or `np.random.Generator` for sampling.
         seqlen: Maximum sequence length.
     Returns:
-        train_loader: List of sampled and tokenized training examples.
+        train_loader: CalibLoader of sampled and tokenized training examples,
+        iterating over the (1, seqlen) input tensors.
         test_enc: Full tokenized PTB validation set.
     """
     from datasets import load_dataset
-    traindata = load_dataset('ptb_text_only', 'penn_treebank', split='train')
-    valdata = load_dataset('ptb_text_only',
+    traindata = load_dataset(path if path else 'ptb_text_only',
+                             'penn_treebank',
+                             split='train')
+    valdata = load_dataset(path if path else 'ptb_text_only',
                            'penn_treebank',
                            split='validation')
 
-    trainenc = tokenizer('\n\n'.join(traindata['sentence']),
-                         return_tensors='pt')
-    testenc = tokenizer('\n\n'.join(valdata['sentence']), return_tensors='pt')
-
-    import random
-    random.seed(seed)
-    trainloader = []
-    for _ in range(nsamples):
-        i = random.randint(0, trainenc.input_ids.shape[1] - seqlen)
-        j = i + seqlen
-        inp = trainenc.input_ids[:, i:j]
-        tar = inp.clone()
-        tar[:, :-1] = -100
-        trainloader.append((inp, tar))
+    trainenc = _cached_tokenize(tokenizer,
+                                '\n\n'.join(traindata['sentence']), 'ptb',
+                                'train')
+    testenc = _cached_tokenize(tokenizer, '\n\n'.join(valdata['sentence']),
+                               'ptb', 'validation')
+
+    trainloader = _sample_windows(trainenc.input_ids, nsamples,
+                                  np.random.default_rng(seed), seqlen)
     return trainloader, testenc
 
 
@@ -82,10 +228,11 @@ def get_c4(tokenizer, nsamples, seed, seqlen, path=None):
     Args:
         tokenizer: Tokenizer to encode text.
         nsamples: Number of samples to take from train set.
-        seed: Random seed for sampling.
+        seed: Random seed or `np.random.Generator` for sampling.
         seqlen: Maximum sequence length.
     Returns:
-        train_loader: List of sampled and tokenized training examples.
+        train_loader: CalibLoader of sampled and tokenized training examples,
+        iterating over the (1, seqlen) input tensors.
         test_enc: Full tokenized PTB validation set.
     """
     from datasets import load_dataset
@@ -102,123 +249,80 @@ def get_c4(tokenizer, nsamples, seed, seqlen, path=None):
         split='validation',
         use_auth_token=False)
 
-    import random
-    random.seed(seed)
-    trainloader = []
-    for _ in range(nsamples):
-        while True:
-            i = random.randint(0, len(traindata) - 1)
-            trainenc = tokenizer(traindata[i]['text'], return_tensors='pt')
-            if trainenc.input_ids.shape[1] >= seqlen:
-                break
-        i = random.randint(0, trainenc.input_ids.shape[1] - seqlen)
-        j = i + seqlen
-        inp = trainenc.input_ids[:, i:j]
-        tar = inp.clone()
-        tar[:, :-1] = -100
-        trainloader.append((inp, tar))
-
-    valenc = []
-    for _ in range(256):
-        while True:
-            i = random.randint(0, len(valdata) - 1)
-            tmp = tokenizer(valdata[i]['text'], return_tensors='pt')
-            if tmp.input_ids.shape[1] >= seqlen:
-                break
-        i = random.randint(0, tmp.input_ids.shape[1] - seqlen)
-        j = i + seqlen
-        valenc.append(tmp.input_ids[:, i:j])
-    valenc = torch.hstack(valenc)
-
-    class TokenizerWrapper:
+    rng = np.random.default_rng(seed)
+    inp = _sample_documents(tokenizer, traindata, nsamples, seqlen, rng, 'c4',
+                            'train')
+    trainloader = _to_trainloader(inp)
 
-        def __init__(self, input_ids):
-            self.input_ids = input_ids
-
-    valenc = TokenizerWrapper(valenc)
+    valenc = _sample_documents(tokenizer, valdata, 256, seqlen, rng, 'c4',
+                               'validation')
+    valenc = TokenizerWrapper(valenc.reshape(1, -1))
 
     return trainloader, valenc
 
 
-def get_ptb_new(tokenizer, nsamples, seed, seqlen):
+def get_ptb_new(tokenizer, nsamples, seed, seqlen, path=None):
     """Load PTB New train and validation datasets and tokenize.
     Args:
         tokenizer: Tokenizer to encode text.
         nsamples: Number of samples to take from train set.
-        seed: Random seed for sampling.
+        seed: Random seed or `np.random.Generator` for sampling.
         seqlen: Maximum sequence length.
     Returns:
-        train_loader: List of sampled and tokenized training examples.
+        train_loader: CalibLoader of sampled and tokenized training examples,
+        iterating over the (1, seqlen) input tensors.
         test_enc: Full tokenized PTB validation set.
     """
     from datasets import load_dataset
-    traindata = load_dataset('ptb_text_only', 'penn_treebank', split='train')
-    testdata = load_dataset('ptb_text_only', 'penn_treebank', split='test')
-
-    trainenc = tokenizer(' '.join(traindata['sentence']), return_tensors='pt')
-    testenc = tokenizer(' '.join(testdata['sentence']), return_tensors='pt')
-
-    import random
-    random.seed(seed)
-    trainloader = []
-    for _ in range(nsamples):
-        i = random.randint(0, trainenc.input_ids.shape[1] - seqlen)
-        j = i + seqlen
-        inp = trainenc.input_ids[:, i:j]
-        tar = inp.clone()
-        tar[:, :-1] = -100
-        trainloader.append((inp, tar))
+    traindata = load_dataset(path if path else 'ptb_text_only',
+                             'penn_treebank',
+                             split='train')
+    testdata = load_dataset(path if path else 'ptb_text_only',
+                            'penn_treebank',
+                            split='test')
+
+    trainenc = _cached_tokenize(tokenizer, ' '.join(traindata['sentence']),
+                                'ptb_new', 'train')
+    testenc = _cached_tokenize(tokenizer, ' '.join(testdata['sentence']),
+                               'ptb_new', 'test')
+
+    trainloader = _sample_windows(trainenc.input_ids, nsamples,
+                                  np.random.default_rng(seed), seqlen)
     return trainloader, testenc
 
 
-def get_c4_new(tokenizer, nsamples, seed, seqlen):
+def get_c4_new(tokenizer, nsamples, seed, seqlen, path=None):
     """Load C4 New train and validation datasets and tokenize.
     Args:
         tokenizer: Tokenizer to encode text.
         nsamples: Number of samples to take from train set.
-        seed: Random seed for sampling.
+        seed: Random seed or `np.random.Generator` for sampling.
         seqlen: Maximum sequence length.
     Returns:
-        train_loader: List of sampled and tokenized training examples.
+        train_loader: CalibLoader of sampled and tokenized training examples,
+        iterating over the (1, seqlen) input tensors.
         test_enc: Full tokenized PTB validation set.
     """
     from datasets import load_dataset
     traindata = load_dataset(
-        'allenai/c4',
+        path if path else 'allenai/c4',
         'allenai--c4',
         data_files={'train': 'en/c4-train.00000-of-01024.json.gz'},
         split='train')
     valdata = load_dataset(
-        'allenai/c4',
+        path if path else 'allenai/c4',
         'allenai--c4',
         data_files={'validation': 'en/c4-validation.00000-of-00008.json.gz'},
         split='validation')
 
-    import random
-    random.seed(seed)
-    trainloader = []
-    for _ in range(nsamples):
-        while True:
-            i = random.randint(0, len(traindata) - 1)
-            trainenc = tokenizer(traindata[i]['text'], return_tensors='pt')
-            if trainenc.input_ids.shape[1] >= seqlen:
-                break
-        i = random.randint(0, trainenc.input_ids.shape[1] - seqlen)
-        j = i + seqlen
-        inp = trainenc.input_ids[:, i:j]
-        tar = inp.clone()
-        tar[:, :-1] = -100
-        trainloader.append((inp, tar))
-
-    valenc = tokenizer(' '.join(valdata[:1100]['text']), return_tensors='pt')
-    valenc = valenc.input_ids[:, :(256 * seqlen)]
-
-    class TokenizerWrapper:
+    rng = np.random.default_rng(seed)
+    inp = _sample_documents(tokenizer, traindata, nsamples, seqlen, rng,
+                            'c4_new', 'train')
+    trainloader = _to_trainloader(inp)
 
-        def __init__(self, input_ids):
-            self.input_ids = input_ids
-
-    valenc = TokenizerWrapper(valenc)
+    valenc = _cached_tokenize(tokenizer, ' '.join(valdata[:1100]['text']),
+                              'c4_new', 'validation')
+    valenc = TokenizerWrapper(valenc.input_ids[:, :(256 * seqlen)])
 
     return trainloader, valenc
 
@@ -228,45 +332,71 @@ def get_pileval(tokenizer, nsamples, seed, path, seqlen=512):
     Args:
         tokenizer: Tokenizer to encode text.
         nsamples: Number of samples to take from train set.
-        seed: Random seed for sampling.
+        seed: Random seed or `np.random.Generator` for sampling.
         seqlen: Maximum sequence length.
     Returns:
-        train_loader: List of sampled and tokenized training examples.
+        train_loader: CalibLoader of sampled and tokenized training examples,
+        iterating over the (1, seqlen) input tensors.
         test_enc: Full tokenized PTB validation set.
     """
+    import torch
     from datasets import load_dataset
     from datasets.builder import DatasetGenerationError
     try:
-        dataset = load_dataset('json', data_files=path, split='train')
+        dataset = load_dataset('json',
+                               data_files=path,
+                               split='train',
+                               streaming=True)
     except DatasetGenerationError as err:
         raise InterruptedError('There have been some issues when generating '
                                'the dataset, you could try to download it '
                                'locally first, and replace the `data_files`'
                                'with local addresses or use other datasets '
                                '(c4, wiki, ptb).') from err
-    dataset = dataset.shuffle(seed=seed)
+    # Stream the corpus through a bounded shuffle buffer instead of loading
+    # and shuffling all of it, and tokenize the lines in batches.
+    dataset = dataset.shuffle(generator=np.random.default_rng(seed),
+                              buffer_size=10_000)
     samples = []
-    n_run = 0
+    lines = []
+
+    def encode_lines():
+        for line_encoded in tokenizer(lines)['input_ids']:
+            if len(line_encoded) > 512 or len(line_encoded) == 0:
+                continue
+            samples.append(line_encoded)
+        lines.clear()
+
     for data in dataset:
-        line = data['text']
-        line = line.strip()
-        line_encoded = tokenizer.encode(line)
-        if len(line_encoded) > 512:
-            continue
-        sample = torch.tensor([line_encoded])
-        if sample.numel() == 0:
-            continue
-        samples.append(sample)
-        n_run += 1
-        if n_run == nsamples:
-            break
-    # now concatenate all samples and split according to block size
-    cat_samples = torch.cat(samples, dim=1)
-    n_split = cat_samples.shape[1] // seqlen
+        lines.append(data['text'].strip())
+        if len(lines) == nsamples:
+            encode_lines()
+            if len(samples) >= nsamples:
+                break
+    if lines:
+        encode_lines()
+    samples = samples[:nsamples]
+    # now concatenate all samples into one preallocated buffer and split it
+    # according to block size
+    cat_samples = torch.empty(sum(len(sample) for sample in samples),
+                              dtype=torch.long)
+    offset = 0
+    for sample in samples:
+        cat_samples[offset:offset + len(sample)] = torch.tensor(sample)
+        offset += len(sample)
+    n_split = cat_samples.shape[0] // seqlen
     print(f' * Split into {n_split} blocks')
-    return [
-        cat_samples[:, i * seqlen:(i + 1) * seqlen] for i in range(n_split)
-    ], None
+    blocks = cat_samples[:n_split * seqlen].view(n_split, 1, seqlen)
+    return CalibLoader(blocks), None
+
+
+def _format_conv(conv):
+    """拼接对话（USER: ...\nASSISTANT: ... 格式）"""
+    parts = []
+    for turn in conv:
+        role = "USER: " if turn['from'] == 'human' else "ASSISTANT: "
+        parts.append(role + turn['value'].strip() + "\n")
+    return ''.join(parts)
 
 
 def get_sharegpt(tokenizer, nsamples, seed, path, seqlen=2048):
@@ -274,16 +404,14 @@ def get_sharegpt(tokenizer, nsamples, seed, path, seqlen=2048):
     Args:
         tokenizer: Tokenizer to encode text.
         nsamples: Number of samples to take.
-        seed: Random seed for sampling.
+        seed: Random seed or `np.random.Generator` for sampling.
         path: Path to ShareGPT JSON dataset.
         seqlen: Maximum sequence length.
     Returns:
-        samples: List of tokenized training examples.
+        samples: CalibLoader of tokenized training examples.
     """
     from datasets import load_dataset
     from datasets.builder import DatasetGenerationError
-    import numpy as np
-    import torch
 
     try:
         dataset = load_dataset('json', data_files=path, split='train')
@@ -292,46 +420,40 @@ def get_sharegpt(tokenizer, nsamples, seed, path, seqlen=2048):
                                'Ensure the path is correct and the format is valid.') from err
 
     # 随机打乱数据集
-    np.random.seed(seed)
-    indices = np.random.permutation(len(dataset))
-    samples = []
-    n_collected = 0
-
-    for idx in indices:
-        # 获取对话样本
-        conv = dataset[int(idx)]['conversations']
-
-        # 拼接对话（USER: ...\nASSISTANT: ... 格式）
-        text = ""
-        for turn in conv:
-            role = "USER: " if turn['from'] == 'human' else "ASSISTANT: "
-            text += role + turn['value'].strip() + "\n"
-
-        # 编码并截断
-        encoded = tokenizer.encode(
-            text,
-            truncation=True,
-            max_length=seqlen,
-            padding='max_length'
-        )
-
-        # 转换为张量 (1, seqlen)
-        sample = torch.tensor([encoded])
-
-        # 确保最终形状为 (1, seqlen)
-        if sample.shape[1] != seqlen:
-            # 如果仍有异常长度（如特殊 token 导致），跳过该样本
-            continue
+    rng = np.random.default_rng(seed)
+    indices = rng.permutation(len(dataset))
 
-        samples.append(sample)
-        n_collected += 1
+    # 一次性批量编码选中的对话
+    batch = dataset.select(indices[:nsamples])
+    texts = [_format_conv(conv) for conv in batch['conversations']]
 
-        if n_collected == nsamples:
-            break
+    # 编码并截断/填充到 seqlen
+    encoded = tokenizer(texts,
+                        truncation=True,
+                        max_length=seqlen,
+                        padding='max_length',
+                        return_tensors='pt')
+
+    # 每个样本形状为 (1, seqlen)
+    samples = CalibLoader(encoded.input_ids.unsqueeze(1))
 
     print(f" * Collected {len(samples)} ShareGPT samples for calibration")
     return samples, None  # 返回样本列表和 None（无测试数据）
 
+
+_PILEVAL_URL = 'https://the-eye.eu/public/AI/pile/val.jsonl.zst'
+
+_LOADERS = {
+    'wikitext2': get_wikitext2,
+    'ptb': get_ptb,
+    'ptb_new': get_ptb_new,
+    'c4': get_c4,
+    'c4_new': get_c4_new,
+    'pileval': get_pileval,
+    'sharegpt': get_sharegpt,
+}
+
+
 def get_calib_loaders(name,
                       tokenizer,
                       nsamples=128,
@@ -343,26 +465,18 @@ def get_calib_loaders(name,
       name: Dataset name ('wikitext2', 'ptb', 'c4', etc).
       tokenizer: Tokenizer to encode text.
       nsamples: Number of samples to take from train set.
-      seed: Random seed for sampling.
+      seed: Random seed or `np.random.Generator` for sampling.
       seqlen: Maximum sequence length.
     Returns:
-      train_loader: List of sampled and tokenized training examples.
+      train_loader: CalibLoader of sampled and tokenized training examples,
+        iterating over the (1, seqlen) input tensors.
       test_data: Full tokenized validation set.
     """
-    if 'wikitext2' in name:
-        return get_wikitext2(tokenizer, nsamples, seed, seqlen, path)
-    if 'ptb' in name:
-        if 'new' in name:
-            return get_ptb_new(tokenizer, nsamples, seed, seqlen)
-        return get_ptb(tokenizer, nsamples, seed, seqlen)
-    if 'c4' in name:
-        if 'new' in name:
-            return get_c4_new(tokenizer, nsamples, seed, seqlen)
-        return get_c4(tokenizer, nsamples, seed, seqlen, path)
-
-    if 'pileval' in name:
-        if path is None:
-            path = 'https://the-eye.eu/public/AI/pile/val.jsonl.zst'
-        return get_pileval(tokenizer, nsamples, seed, path, seqlen)
-    if 'sharegpt' in name.lower():
-        return get_sharegpt(tokenizer, nsamples, seed, path, seqlen)
\ No newline at end of file
+    loader = _LOADERS.get(name.lower())
+    if loader is None:
+        raise ValueError(f'Unsupported calibration dataset {name!r}, '
+                         f'expected one of {sorted(_LOADERS)}.')
+    if loader is get_pileval and path is None:
+        path = _PILEVAL_URL
+    rng = np.random.default_rng(seed)
+    return loader(tokenizer, nsamples, rng, seqlen=seqlen, path=path)
@@ -4,18 +4,29 @@
 
 # Copyright (c) OpenMMLab. All rights reserved.
 
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 
-import fire
 import torch
-from accelerate import (infer_auto_device_map, init_empty_weights,
-                        load_checkpoint_in_model)
-from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+import torch.distributed as dist
+from accelerate import init_empty_weights, load_checkpoint_in_model
+from safetensors.torch import load_file, save_file
+from torch import nn
+from transformers import (AutoConfig, AutoModelForCausalLM, AutoTokenizer,
+                          PreTrainedTokenizer)
 
-from vllm.kv_quant.calib_dataloader import get_calib_loaders
+from vllm.kv_quant.calib_dataloader import CalibLoader, get_calib_loaders
 from vllm.kv_quant.calibration import CalibrationContext
 from vllm.kv_quant.utils import collect_target_modules
 
+_CALIB_CACHE_DIR = Path.home() / '.cache' / 'vllm_kvquant'
+
 LAYER_TYPE_MAP = {
     'InternLMForCausalLM': 'InternLMDecoderLayer',
     'QWenLMHeadModel': 'QWenBlock',
@@ -30,15 +41,173 @@ NORM_TYPE_MAP = {
 }
 
 
+def _has_weights(folder: str) -> bool:
+    """Whether `folder` holds complete safetensors or pytorch bin weights,
+    i.e. every shard named by their index if they are sharded."""
+    folder = Path(folder)
+    for ext in ('safetensors', 'bin'):
+        index = next(folder.glob(f'*.{ext}.index.json'), None)
+        if index is not None:
+            weight_map = json.loads(index.read_text())['weight_map']
+            return all((folder / f).exists() for f in set(weight_map.values()))
+        if next(folder.glob(f'*.{ext}'), None) is not None:
+            return True
+    return False
+
+
+def _resolve_checkpoint(checkpoint: str) -> str:
+    """Return a local directory holding the checkpoint, downloading only its
+    safetensors weights (or the pytorch bin weights if it has none) from the
+    HuggingFace Hub when `checkpoint` is a repo id.
+
+    A snapshot already in the local Hub cache is used without contacting
+    the Hub, so that calibration works offline and with HF_HUB_OFFLINE set.
+    """
+    if os.path.isdir(checkpoint):
+        return checkpoint
+    from huggingface_hub import list_repo_files, snapshot_download
+    from huggingface_hub.utils import LocalEntryNotFoundError
+    try:
+        cached = snapshot_download(checkpoint, local_files_only=True)
+    except LocalEntryNotFoundError:
+        cached = None
+    # Loading the config alone also creates a snapshot, so check that the
+    # cached one has the weights.
+    if cached is not None and _has_weights(cached):
+        return cached
+    files = list_repo_files(checkpoint)
+    if any(f.endswith('.safetensors') for f in files):
+        weights = ['*.safetensors', '*.safetensors.index.json']
+    else:
+        weights = ['*.bin', '*.bin.index.json']
+    return snapshot_download(checkpoint, allow_patterns=['*.json'] + weights)
+
+
+def _get_layer_and_norm_types(model: nn.Module) -> Tuple[str, str]:
+    """Names of the decoder layer and norm classes of `model`.
+
+    They are read off `model.model.layers` and `model.model.norm`, which
+    covers most HuggingFace decoder-only models, and otherwise looked up in
+    LAYER_TYPE_MAP / NORM_TYPE_MAP.
+    """
+    inner = getattr(model, 'model', None)
+    layers = getattr(inner, 'layers', None)
+    norm = getattr(inner, 'norm', None)
+    if layers is not None and len(layers) > 0 and norm is not None:
+        return type(layers[0]).__name__, type(norm).__name__
+
+    arch = type(model).__name__
+    if arch not in LAYER_TYPE_MAP:
+        raise ValueError(f'Cannot find the decoder layers of {arch}, '
+                         'please add it to LAYER_TYPE_MAP and NORM_TYPE_MAP.')
+    return LAYER_TYPE_MAP[arch], NORM_TYPE_MAP[arch]
+
+
+def _build_device_map(model: nn.Module, cpu_modules: List[str],
+                      device: str) -> Dict[str, str]:
+    """Device map that keeps `cpu_modules` and the lm_head on CPU and puts
+    every other module of `model` on `device`.
+
+    Modules holding some of `cpu_modules` are split into their children (and
+    their own parameters and buffers), so every entry is placed as a whole.
+    """
+    device_map = {}
+
+    def _visit(prefix: str, module: nn.Module):
+        tensors = itertools.chain(module.named_parameters(recurse=False),
+                                  module.named_buffers(recurse=False))
+        for name, _ in tensors:
+            device_map[prefix + name] = device
+        for name, child in module.named_children():
+            full_name = prefix + name
+            if full_name in cpu_modules or name == 'lm_head':
+                device_map[full_name] = 'cpu'
+            elif any(m.startswith(full_name + '.') for m in cpu_modules):
+                _visit(full_name + '.', child)
+            else:
+                device_map[full_name] = device
+
+    _visit('', model)
+    return device_map
+
+
+def _load_tokenizer(model: str) -> PreTrainedTokenizer:
+    """Load the tokenizer, preferring the fast one and falling back to the
+    slow one when it cannot be built for this model."""
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model,
+                                                  use_fast=True,
+                                                  trust_remote_code=True)
+    except Exception as err:
+        print(f'Fast tokenizer unavailable ({err}), using the slow one')
+        tokenizer = AutoTokenizer.from_pretrained(model,
+                                                  use_fast=False,
+                                                  trust_remote_code=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+        print("Set pad_token to eos_token")
+    return tokenizer
+
+
+def _get_calib_dtype(device: Union[str, torch.device]) -> torch.dtype:
+    """bfloat16 on CUDA devices of compute capability 8.0 and newer, whose
+    wider exponent range avoids fp16 overflow in activations at the same
+    speed; float16 elsewhere, including ROCm."""
+    device = torch.device(device)
+    if (device.type == 'cuda' and torch.cuda.is_available()
+            and torch.version.hip is None
+            and torch.cuda.get_device_capability(device)[0] >= 8):
+        return torch.bfloat16
+    return torch.float16
+
+
+def _load_calib_samples(calib_dataset: str, tokenizer: PreTrainedTokenizer,
+                        calib_samples: int, calib_seqlen: int,
+                        dataset_path: Optional[str]) -> CalibLoader:
+    """Load the tokenized calibration samples, caching their input ids as
+    safetensors under `~/.cache/vllm_kvquant/` so reruns skip dataset
+    loading and tokenization."""
+    key = hashlib.sha1(
+        f'{calib_dataset}-{dataset_path}-{calib_samples}-{calib_seqlen}-'
+        f'{tokenizer.__class__.__name__}-{tokenizer.name_or_path}-'
+        f'{len(tokenizer)}'.encode()).hexdigest()
+    cache_file = _CALIB_CACHE_DIR / f'{calib_dataset}-{key}.safetensors'
+    if cache_file.exists():
+        return CalibLoader(load_file(cache_file)['inps'])
+
+    calib_loader, _ = get_calib_loaders(calib_dataset,
+                                        tokenizer,
+                                        nsamples=calib_samples,
+                                        seqlen=calib_seqlen,
+                                        path=dataset_path)
+    _CALIB_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+    save_file({'inps': calib_loader.inps.contiguous()}, tmp_file)
+    os.replace(tmp_file, cache_file)
+    return calib_loader
+
+
 def calibrate(model: str,
               calib_dataset: str = 'c4',
               calib_samples: int = 128,
               calib_seqlen: int = 2048,
               work_dir: str = './work_dir',
-              device: str = 'cuda',
-              dataset_path: str = None) -> None:
+              device: Optional[str] = None,
+              dataset_path: str = None,
+              calib_batch_size: int = 16,
+              compile_layers: bool = False,
+              min_samples: int = 32,
+              tol: float = 0.0,
+              data_free: bool = False,
+              k_quant_axis: str = 'channel',
+              v_quant_axis: str = 'token') -> None:
     """The main function for loading the model and performing calibration on a
     given dataset.
+
+    Under torchrun (WORLD_SIZE > 1) a process group is initialized from the
+    environment unless one already is, each rank calibrates its own copy of
+    the model on its local GPU with every world_size-th sample, and the stats
+    are reduced over the ranks before rank 0 exports them.
     Args:
         model (str): The model to be loaded.
         calib_dataset (str, optional): The calibration dataset name.
@@ -50,52 +219,162 @@ def calibrate(model: str,
         work_dir (str): The working directory for outputs.
             Defaults to './work_dir'.
         device (str, optional): The device to be used for calculation.
-            Defaults to 'cuda'.
+            Defaults to None, which loads the model onto 'cuda' and runs the
+            calibration on the device holding the input embeddings.
+        dataset_path (str, optional): Local path of the calibration dataset.
+            Defaults to None.
+        calib_batch_size (int, optional): The number of samples moved to the
+            device and forwarded at a time. Defaults to 16.
+        compile_layers (bool, optional): Whether to run the decoder layers
+            through torch.compile. Defaults to False.
+        min_samples (int, optional): The number of samples to forward before
+            calibration may stop early. Defaults to 32.
+        tol (float, optional): Stop calibrating a layer once its per-channel
+            key/value ranges change by less than this relative amount between
+            two batches, e.g. 0.01. Defaults to 0, which always uses all the
+            samples.
+        data_free (bool, optional): Skip the tokenizer, the dataset and the
+            forward passes and estimate symmetric key/value ranges from the
+            k_proj/v_proj weights; export them with `kv_sym`. Only the key
+            and value stats are written. Defaults to False.
+        k_quant_axis (str, optional): Quantization axis of the keys,
+            'channel' or 'token'. Defaults to 'channel'.
+        v_quant_axis (str, optional): Quantization axis of the values,
+            'channel' or 'token'. Defaults to 'token'.
     """
 
-    assert calib_dataset in ['c4', 'ptb', 'wikitext2', 'pileval', 'sharegpt'], \
-        'Support only `c4`, `ptb`, `wikitext2` or `pileval`/`sharegpt`.'
+    if (dist.is_available() and not dist.is_initialized()
+            and int(os.environ.get('WORLD_SIZE', '1')) > 1):
+        dist.init_process_group(
+            'nccl' if torch.cuda.is_available() else 'gloo')
+    dist_reduce = dist.is_available() and dist.is_initialized()
+    rank, world_size = 0, 1
+    if dist_reduce:
+        rank, world_size = dist.get_rank(), dist.get_world_size()
+        if torch.cuda.is_available():
+            local_rank = int(
+                os.environ.get('LOCAL_RANK',
+                               rank % torch.cuda.device_count()))
+            torch.cuda.set_device(local_rank)
+            device = device or f'cuda:{local_rank}'
 
-    # Load tokenizer and configuration
-    tokenizer = AutoTokenizer.from_pretrained(model,
-                                              use_fast=False,
-                                              trust_remote_code=True)
-    if tokenizer.pad_token is None:
-        tokenizer.pad_token = tokenizer.eos_token
-        print("Set pad_token to eos_token")
+    if data_free and rank != 0:
+        # The weights give every rank the same stats.
+        return
+
+    if not data_free:
+        assert calib_dataset in [
+            'c4', 'ptb', 'wikitext2', 'pileval', 'sharegpt'
+        ], 'Support only `c4`, `ptb`, `wikitext2` or `pileval`/`sharegpt`.'
+
+        # Load the tokenizer in the background while the config and the
+        # weights are loaded on this thread.
+        executor = ThreadPoolExecutor(max_workers=1)
+        tokenizer_future = executor.submit(_load_tokenizer, model)
+        executor.shutdown(wait=False)
     hf_config = AutoConfig.from_pretrained(model, trust_remote_code=True)
     checkpoint = hf_config._name_or_path
 
-    # 直接加载模型到 GPU 上（无需 init_empty_weights）
-    model = AutoModelForCausalLM.from_pretrained(model,
-                                                 torch_dtype=torch.float16,
-                                                 trust_remote_code=True,
-                                                 device_map='auto')
+    # Build the model without allocating weights, then load the checkpoint
+    # straight into its final placement: decoder layers stay on CPU (the
+    # calibration context moves each one to the device while it runs), the
+    # remaining modules go to the device. Without data nothing is run, so
+    # everything stays on CPU.
+    calib_dtype = _get_calib_dtype(device or 'cuda')
+    with init_empty_weights():
+        model = AutoModelForCausalLM.from_config(hf_config,
+                                                 torch_dtype=calib_dtype,
+                                                 trust_remote_code=True)
     model.config.use_cache = False
+    model.eval()
 
-    layer_type = LAYER_TYPE_MAP[type(model).__name__]
-    norm_type = NORM_TYPE_MAP[type(model).__name__]
+    layer_type, norm_type = _get_layer_and_norm_types(model)
+
+    if data_free:
+        device_map = {'': 'cpu'}
+    else:
+        decoder_layers = collect_target_modules(model, layer_type)
+        device_map = _build_device_map(model, list(decoder_layers),
+                                       device or 'cuda')
+    load_checkpoint_in_model(model,
+                             _resolve_checkpoint(checkpoint),
+                             device_map=device_map,
+                             dtype=calib_dtype)
+    input_device = (torch.device(device)
+                    if device else model.get_input_embeddings().weight.device)
+
+    if data_free:
+        calib_ctx = CalibrationContext(model,
+                                       None,
+                                       layer_type=layer_type,
+                                       norm_type=norm_type,
+                                       device=input_device,
+                                       k_axis=k_quant_axis,
+                                       v_axis=v_quant_axis)
+        calib_ctx.calibrate_from_weights()
+        work_dir = Path(work_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        calib_ctx.export(work_dir)
+        return
+
+    tokenizer = tokenizer_future.result()
 
     print('Loading calibrate dataset ...')
-    calib_loader, _ = get_calib_loaders(calib_dataset,
-                                        tokenizer,
-                                        nsamples=calib_samples,
-                                        seqlen=calib_seqlen,
-                                        path=dataset_path)
+    calib_loader = _load_calib_samples(calib_dataset, tokenizer,
+                                       calib_samples, calib_seqlen,
+                                       dataset_path)
+
+    # With a process group, every rank runs its own copy of the model on a
+    # strided share of the samples.
+    samples = itertools.islice(calib_loader, rank, None, world_size)
 
     # Initialize calibration context
     calib_ctx = CalibrationContext(model,
                                    tokenizer,
                                    layer_type=layer_type,
                                    norm_type=norm_type,
-                                   device=device)
+                                   device=input_device,
+                                   compile_layers=compile_layers,
+                                   k_axis=k_quant_axis,
+                                   v_axis=v_quant_axis)
+
+    # Stream the samples batch by batch instead of moving the whole corpus
+    # to the device at once. Each batch is written straight into a
+    # preallocated (pinned) buffer, so the host-to-device copy runs async.
+    pin_memory = input_device.type == 'cuda'
 
+    def _batches():
+        batch, row = None, 0
+        for data in samples:
+            if batch is None:
+                batch = torch.empty((calib_batch_size, calib_seqlen),
+                                    dtype=torch.long,
+                                    pin_memory=pin_memory)
+            batch[row:row + data.shape[0]] = data
+            row += data.shape[0]
+            if row == calib_batch_size:
+                yield batch
+                batch, row = None, 0
+        if row:
+            yield batch[:row]
+
+    # The per-channel KV statistics are dominated by a few outlier channels
+    # and may converge well before the whole corpus is seen, so each layer
+    # can stop once its ranges settle.
     with calib_ctx:
-        all_data = torch.cat([
-            data if isinstance(data, torch.Tensor) else data[0]
-            for data in calib_loader
-        ]).to(device)
-        calib_ctx.calibrate(all_data)
+        calib_ctx.calibrate_batches(
+            (batch.to(input_device, non_blocking=pin_memory)
+             for batch in _batches()),
+            min_samples=min_samples,
+            tol=tol)
+
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+    if dist_reduce:
+        calib_ctx.reduce_stats()
+        if rank != 0:
+            return
 
     # Create work directory if not exists
     work_dir = Path(work_dir)
@@ -104,4 +383,43 @@ def calibrate(model: str,
 
 
 if __name__ == '__main__':
-    fire.Fire(calibrate)
\ No newline at end of file
+    # Expandable segments curb the fragmentation caused by alternating large
+    # sample buffers, activations and small per-layer stats. This has to be
+    # set before the CUDA caching allocator is initialized, and is left to
+    # library callers otherwise.
+    os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF',
+                          'expandable_segments:True,max_split_size_mb:512')
+    parser = argparse.ArgumentParser(
+        description='Calibrate the int8 KV cache of a HuggingFace model.')
+    parser.add_argument('--model', type=str, required=True)
+    parser.add_argument('--calib_dataset',
+                        type=str,
+                        default='c4',
+                        choices=['c4', 'ptb', 'wikitext2', 'pileval',
+                                 'sharegpt'])
+    parser.add_argument('--calib_samples', type=int, default=128)
+    parser.add_argument('--calib_seqlen', type=int, default=2048)
+    parser.add_argument('--work_dir', type=str, default='./work_dir')
+    parser.add_argument('--device', type=str, default=None)
+    parser.add_argument('--dataset_path', type=str, default=None)
+    parser.add_argument('--calib_batch_size', type=int, default=16)
+    parser.add_argument('--compile_layers', action='store_true')
+    parser.add_argument('--min_samples', type=int, default=32)
+    parser.add_argument('--tol',
+                        type=float,
+                        default=0.0,
+                        help='relative KV range change to stop early at, '
+                        'e.g. 0.01; 0 uses all the samples')
+    parser.add_argument('--data_free',
+                        action='store_true',
+                        help='derive symmetric KV ranges from the k_proj/'
+                        'v_proj weights without a calibration dataset')
+    parser.add_argument('--k_quant_axis',
+                        type=str,
+                        default='channel',
+                        choices=['channel', 'token'])
+    parser.add_argument('--v_quant_axis',
+                        type=str,
+                        default='token',
+                        choices=['channel', 'token'])
+    calibrate(**vars(parser.parse_args()))
\ No newline at end of file
@@ -1,6 +1,7 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import contextlib
 from functools import partial
-from typing import Union
+from typing import Iterable, Optional, Union
 
 import torch
 import transformers
@@ -10,8 +11,38 @@ from transformers import PreTrainedTokenizer
 
 from vllm.kv_quant.observer import ActivationObserver, KVCacheObserver
 from vllm.kv_quant.utils import (bimap_name_mod, collect_target_modules,
-                                 concat_decoder_layer_outputs,
+                                 concat_decoder_layer_outputs, save_stats,
                                  split_decoder_layer_inputs)
+from vllm.logger import init_logger
+
+logger = init_logger(__name__)
+
+
+class _LayerInputsCaught(Exception):
+    """Raised to stop the model forward once the inputs of the first decoder
+    layer are captured."""
+
+
+def _map_tensors(obj, fn):
+    """Apply `fn` to every tensor in nested tuples, lists and dicts."""
+    if isinstance(obj, torch.Tensor):
+        return fn(obj)
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(_map_tensors(o, fn) for o in obj)
+    if isinstance(obj, dict):
+        return {k: _map_tensors(v, fn) for k, v in obj.items()}
+    return obj
+
+
+def _offload(tensor: torch.Tensor) -> torch.Tensor:
+    """Copy a tensor to host memory, pinned if CUDA is available so that it
+    can be copied back asynchronously."""
+    if tensor.device.type == 'cpu':
+        return tensor
+    buf = torch.empty(tensor.shape,
+                      dtype=tensor.dtype,
+                      pin_memory=torch.cuda.is_available())
+    return buf.copy_(tensor)
 
 
 class CalibrationContext():
@@ -22,6 +53,10 @@ class CalibrationContext():
       - layer_type: Layer type to be targeted for calibration
       - norm_type: Normalization type used for calibration
       - device: Device on which model is to be calibrated ('cpu' or 'cuda')
+      - compile_layers: Whether to run the decoder layers through
+        torch.compile
+      - k_axis / v_axis: Quantization axis ('channel' or 'token') the key
+        and value stats are collected for
     """
 
     inp_obs_group = 'inputs'
@@ -31,18 +66,29 @@ class CalibrationContext():
 
     def __init__(self,
                  model: nn.Module,
-                 tokenizer: PreTrainedTokenizer,
+                 tokenizer: Optional[PreTrainedTokenizer],
                  layer_type: Union[str, type],
                  norm_type: Union[str, type],
-                 device: str = 'cuda') -> None:
+                 device: str = 'cuda',
+                 compile_layers: bool = False,
+                 k_axis: str = 'channel',
+                 v_axis: str = 'token') -> None:
         """Initiate calibration context.
         Args:
             model (nn.Module): Model to be calibrated.
-            tokenizer (PreTrainedTokenizer): Tokenizer of the given model.
+            tokenizer (PreTrainedTokenizer, optional): Tokenizer of the given
+                model, not needed for `calibrate_from_weights`.
             layer_type (Union[str, type]): Type of the layers to be observed.
             norm_type (Union[str, type]): Norm type used in the model.
             device (str, optional): Device where the model should run.
                 Defaults to 'cuda'.
+            compile_layers (bool, optional): Whether to compile the original
+                decoder layer forwards with torch.compile. Dynamo failures
+                fall back to eager. Defaults to False.
+            k_axis (str, optional): Quantization axis of the keys, 'channel'
+                or 'token'. Defaults to 'channel'.
+            v_axis (str, optional): Quantization axis of the values,
+                'channel' or 'token'. Defaults to 'token'.
         """
 
         self.layer_type = layer_type
@@ -71,9 +117,15 @@ class CalibrationContext():
         self._init_input_observers(self.name2fc)
         self._init_output_observers(self.name2norm)
         self._init_output_observers(self.name2fc)
+        self.k_axis = k_axis
+        self.v_axis = v_axis
         self._init_kv_observers(self.name2layer)
 
         self.device = device
+        self.compile_layers = compile_layers and hasattr(torch, 'compile')
+        # Set by calibrate_from_weights(), whose stats cover keys and values
+        # only.
+        self.data_free = False
 
     def _guess_num_heads(self, model):
 
@@ -101,8 +153,10 @@ class CalibrationContext():
     def _init_kv_observers(self, name2mod):
         """Initialize KV observers for given modules."""
         for name in name2mod:
-            k_obs = KVCacheObserver(self.num_kv_heads, self.head_dim)
-            v_obs = KVCacheObserver(self.num_kv_heads, self.head_dim)
+            k_obs = KVCacheObserver(self.num_kv_heads, self.head_dim,
+                                    self.k_axis)
+            v_obs = KVCacheObserver(self.num_kv_heads, self.head_dim,
+                                    self.v_axis)
             k_obs.global_available(name, group=self.key_obs_group)
             v_obs.global_available(name, group=self.value_obs_group)
 
@@ -146,11 +200,9 @@ class CalibrationContext():
 
         def _forward(mod, *args, **kwargs):
 
-            mod.to(self.device)
             batch_args, batch_kwargs = split_decoder_layer_inputs(
                 *args, **kwargs)
             batch_outputs = []
-            samples = len(batch_args)
 
             m_name = self.mod2name[mod]
             k_obs = KVCacheObserver.find(m_name, group=self.key_obs_group)
@@ -161,7 +213,11 @@ class CalibrationContext():
                 if k_obs and v_obs:
                     batch_kwargs[i]['use_cache'] = True
                     version = parse_version(transformers.__version__)
-                    use_new_cache = type(mod).__name__ == 'LlamaDecoderLayer'
+                    # Attention modules that index a shared cache by
+                    # layer_idx (Llama, Mistral, Qwen2, ...) return their
+                    # keys and values through a Cache object.
+                    use_new_cache = hasattr(getattr(mod, 'self_attn', None),
+                                            'layer_idx')
                     if version > parse_version('4.36.0') and use_new_cache:
                         from transformers.cache_utils import DynamicCache
                         batch_kwargs[i]['past_key_value'] = DynamicCache()
@@ -169,8 +225,8 @@ class CalibrationContext():
                         ori_idx = mod.self_attn.layer_idx
                         mod.self_attn.layer_idx = 0
 
-                        out = self._ori_forwards[mod](*batch_args[i],
-                                                      **batch_kwargs[i])
+                        out = self._layer_forwards[mod](*batch_args[i],
+                                                        **batch_kwargs[i])
                         mod.self_attn.layer_idx = ori_idx
 
                         out = list(out)
@@ -182,8 +238,8 @@ class CalibrationContext():
                         k_obs.observe(key)
                         v_obs.observe(value)
                     else:
-                        out = self._ori_forwards[mod](*batch_args[i],
-                                                      **batch_kwargs[i])
+                        out = self._layer_forwards[mod](*batch_args[i],
+                                                        **batch_kwargs[i])
                         out = list(out)
                         key, value = out.pop(-1)
                         k_obs.observe(key)
@@ -193,23 +249,35 @@ class CalibrationContext():
                     torch.cuda.empty_cache()
                     batch_outputs.append(tuple(out))
                 else:
-                    batch_outputs.append(self._ori_forwards[mod](
+                    batch_outputs.append(self._layer_forwards[mod](
                         *batch_args[i], **batch_kwargs[i]))
 
             outputs = concat_decoder_layer_outputs(batch_outputs)
 
             del batch_outputs, batch_args, batch_kwargs, args
-            mod.to('cpu')
-            torch.cuda.empty_cache()
-            max_memory = torch.cuda.max_memory_allocated() / 1024 / 1024 / 1024
-            print(f'{m_name}, samples: {samples}, '
-                  f'max gpu memory: {max_memory:.2f} GB')
             return outputs
 
+        self._layer_forwards = {}
         for layer in self.name2layer.values():
             self._ori_forwards[layer] = layer.forward
+            forward = layer.forward
+            if self.compile_layers:
+                forward = torch.compile(forward, dynamic=False)
+            self._layer_forwards[layer] = forward
             layer.forward = partial(_forward, layer)
 
+    def _dynamo_config(self):
+        """Dynamo settings for running the compiled layers, applied only
+        while calibrating so that the rest of the process is unaffected."""
+        if not self.compile_layers:
+            return contextlib.nullcontext()
+        # Every layer is compiled separately and runs at a fixed shape.
+        # Anything Dynamo cannot handle runs eagerly instead of failing.
+        import torch._dynamo
+        return torch._dynamo.config.patch(
+            cache_size_limit=max(torch._dynamo.config.cache_size_limit, 64),
+            suppress_errors=True)
+
     def collect_inputs_stats(self):
         """Collect statistics (min, max, absmax values) of the observed inputs.
         Returns a dictionary with these collected stats.
@@ -271,33 +339,210 @@ class CalibrationContext():
             value_stats['absmax'][name] = obs.absmax_val
         return key_stats, value_stats
 
+    def _kv_ranges(self, name: str) -> torch.Tensor:
+        """Ranges (max - min) of the keys and values of layer `name` observed
+        so far along their quantization axes, flattened into one tensor."""
+        k_obs = KVCacheObserver.find(name, group=self.key_obs_group)
+        v_obs = KVCacheObserver.find(name, group=self.value_obs_group)
+        return torch.cat([(obs.max_val - obs.min_val).float().flatten()
+                          for obs in (k_obs, v_obs)])
+
+    @torch.no_grad()
+    def calibrate_from_weights(self, act_range: float = 8.0):
+        """Data-free calibration: estimate the key and value ranges of every
+        layer from its k_proj/v_proj weights instead of forwarding samples.
+
+        Every projected channel is taken as its weight row, scaled by the
+        gain of the layer's input norm, applied to an input of unit RMS, so
+        its std is the row norm and `act_range` stds bound it symmetrically.
+        The rotary embedding rotates pairs of key channels, so the two
+        channels of a pair share the norm of their bounds.
+        Args:
+            act_range (float, optional): Bound of the projected channels in
+                units of their std. Defaults to 8.0.
+        """
+        self.data_free = True
+        for name, layer in self.name2layer.items():
+            attn = getattr(layer, 'self_attn', None)
+            if not (hasattr(attn, 'k_proj') and hasattr(attn, 'v_proj')):
+                raise ValueError('Data-free calibration needs separate '
+                                 f'k_proj and v_proj modules in {name}.')
+            norm = getattr(layer, 'input_layernorm', None)
+            gain = norm.weight.float() if norm is not None else 1.0
+
+            k_obs = KVCacheObserver.find(name, group=self.key_obs_group)
+            v_obs = KVCacheObserver.find(name, group=self.value_obs_group)
+            for obs, proj in ((k_obs, attn.k_proj), (v_obs, attn.v_proj)):
+                absmax = (proj.weight.float() * gain).norm(dim=1) * act_range
+                if proj.bias is not None:
+                    absmax = absmax + proj.bias.float().abs()
+                absmax = absmax.view(self.num_kv_heads, self.head_dim)
+                if obs is k_obs:
+                    pairs = absmax.view(self.num_kv_heads, 2, -1)
+                    absmax = pairs.norm(dim=1, keepdim=True).expand_as(
+                        pairs).reshape(self.num_kv_heads, self.head_dim)
+                if obs.axis == 'token':
+                    absmax = absmax.max(-1, keepdim=True)[0]
+                absmax = absmax.cpu().to(obs.absmax_val.dtype)
+                obs.max_val = torch.maximum(obs.max_val, absmax)
+                obs.min_val = torch.minimum(obs.min_val, -absmax)
+                obs.absmax_val = torch.maximum(obs.absmax_val, absmax)
+
+    def reduce_stats(self):
+        """All-reduce the observed stats over the ranks of the default
+        process group: max/min stats with MAX/MIN, and means weighted by the
+        number of batches each rank observed. Every rank has to call this
+        after calibrating on its own share of the samples."""
+        import torch.distributed as dist
+
+        if dist.get_backend() == 'nccl':
+            device = torch.device('cuda', torch.cuda.current_device())
+        else:
+            device = torch.device('cpu')
+
+        def _reduce(tensor, op):
+            buf = tensor.to(device, torch.float32)
+            dist.all_reduce(buf, op=op)
+            return buf.to('cpu', tensor.dtype)
+
+        groups = [
+            ActivationObserver.find_group(self.inp_obs_group),
+            ActivationObserver.find_group(self.out_obs_group),
+            KVCacheObserver.find_group(self.key_obs_group),
+            KVCacheObserver.find_group(self.value_obs_group)
+        ]
+        for obs_group in groups:
+            for obs in obs_group.values():
+                obs.max_val = _reduce(obs.max_val, dist.ReduceOp.MAX)
+                obs.min_val = _reduce(obs.min_val, dist.ReduceOp.MIN)
+                obs.absmax_val = _reduce(obs.absmax_val, dist.ReduceOp.MAX)
+                if not isinstance(obs, ActivationObserver):
+                    continue
+                count = torch.tensor(float(obs.num_batches_tracked))
+                total = _reduce(count, dist.ReduceOp.SUM).clamp_min(1)
+                obs.mean_val = (_reduce(obs.mean_val.float() * count,
+                                        dist.ReduceOp.SUM) /
+                                total).to(obs.mean_val.dtype)
+                obs.absmean_val = (_reduce(obs.absmean_val.float() * count,
+                                           dist.ReduceOp.SUM) /
+                                   total).to(obs.absmean_val.dtype)
+                obs.num_batches_tracked = int(total.item())
+
     def export(self, out_dir):
         """Export the calibration statistics (inputs, outputs, keys and values)
         to specified directory.
+        After `calibrate_from_weights` only the key and value stats are written,
+        as no activations were observed.
         Args:
             out_dir (Union[str, Path]): The directory path where the stats
                 will be saved.
         """
 
-        inp_stats = self.collect_inputs_stats()
-        torch.save(inp_stats, out_dir / 'inputs_stats.pth')
+        if not self.data_free:
+            inp_stats = self.collect_inputs_stats()
+            save_stats(inp_stats, out_dir / 'inputs_stats.safetensors')
 
-        out_stats = self.collect_outputs_stats()
-        torch.save(out_stats, out_dir / 'outputs_stats.pth')
+            out_stats = self.collect_outputs_stats()
+            save_stats(out_stats, out_dir / 'outputs_stats.safetensors')
 
         key_stats, value_stats = self.collect_kv_stats()
-        torch.save(key_stats, out_dir / 'key_stats.pth')
-        torch.save(value_stats, out_dir / 'value_stats.pth')
+        save_stats(key_stats, out_dir / 'key_stats.safetensors')
+        save_stats(value_stats, out_dir / 'value_stats.safetensors')
 
     def calibrate(self, data):
         """Forward pass through the model in inference mode with given data."""
+        self.calibrate_batches([data])
 
+    def _capture_layer_inputs(self, batches: Iterable[torch.Tensor]):
+        """Run the model up to its first decoder layer on every batch and
+        return the (args, kwargs) the layer was called with, offloaded to
+        host memory."""
         if type(self.model).__name__ == 'QWenLMHeadModel':
             model = self.model.transformer
         else:
             model = self.model.model
-        with torch.inference_mode():
-            _ = model(data.to(self.device))
+
+        captured = []
+
+        def _catch(mod, args, kwargs):
+            captured.append(_map_tensors((args, kwargs), _offload))
+            raise _LayerInputsCaught
+
+        first_layer = next(iter(self.name2layer.values()))
+        handle = first_layer.register_forward_pre_hook(_catch,
+                                                       with_kwargs=True)
+        try:
+            for data in batches:
+                try:
+                    model(data.to(self.device))
+                except _LayerInputsCaught:
+                    pass
+        finally:
+            handle.remove()
+        return captured
+
+    def calibrate_batches(self,
+                          batches: Iterable[torch.Tensor],
+                          min_samples: int = 0,
+                          tol: float = 0.0):
+        """Calibrate layer by layer: every decoder layer is moved to the
+        device once and runs all the batches before the next one, instead of
+        being moved for each batch. The hidden states of the batches are
+        kept in pinned host memory between layers, so only the batch that
+        is running is on the device. Has to run inside the context.
+        Args:
+            batches (Iterable[torch.Tensor]): Batches of input ids.
+            min_samples (int, optional): The number of samples a layer runs
+                before it may stop early. Defaults to 0.
+            tol (float, optional): A layer stops once its per-channel
+                key/value ranges change by less than this relative amount
+                between two batches; later layers only run the batches it
+                ran. 0 runs all the batches. Defaults to 0.0.
+        """
+        def _to_device(tensor):
+            return tensor.to(self.device, non_blocking=True)
+
+        with self._dynamo_config(), torch.inference_mode():
+            layer_inputs = self._capture_layer_inputs(batches)
+            for name, layer in self.name2layer.items():
+                layer.to(self.device)
+                layer_outputs = []
+                num_seen, prev_ranges = 0, None
+                for i, (args, kwargs) in enumerate(layer_inputs):
+                    layer_inputs[i] = None
+                    out = layer(*_map_tensors(args, _to_device),
+                                **_map_tensors(kwargs, _to_device))
+                    hidden = out[0] if isinstance(out, tuple) else out
+                    layer_outputs.append(
+                        ((_offload(hidden), ) + args[1:], kwargs))
+                    num_seen += hidden.size(0)
+                    if tol <= 0:
+                        continue
+                    ranges = self._kv_ranges(name)
+                    if prev_ranges is not None and num_seen >= min_samples:
+                        delta = ((ranges - prev_ranges).abs() /
+                                 prev_ranges.clamp_min(1e-6)).max().item()
+                        if delta < tol:
+                            logger.info(f'{name}: KV ranges converged after '
+                                        f'{num_seen} samples')
+                            break
+                    prev_ranges = ranges
+                layer_inputs = layer_outputs
+                layer.to('cpu')
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+                    max_memory = torch.cuda.max_memory_allocated() / 1024**3
+                    logger.debug(f'{name}, samples: {num_seen}, '
+                                 f'max gpu memory: {max_memory:.2f} GB')
+
+            # Norms after the last decoder layer are observed as well.
+            for norm_name, norm in self.name2norm.items():
+                if any(
+                        norm_name.startswith(l_name + '.')
+                        for l_name in self.name2layer):
+                    continue
+                for args, _ in layer_inputs:
+                    norm(_to_device(args[0]))
 
     def __enter__(self):
         """Prepares the Calibration object for a 'with' statement by
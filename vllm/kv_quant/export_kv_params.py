@@ -6,13 +6,40 @@ import fire
 import numpy as np
 import torch
 
+from vllm.kv_quant.utils import load_stats
+
+
+def _load_stats(work_dir: Path, name: str) -> dict:
+    """Load stats exported by calibration, falling back to the pickled
+    `.pth` files written by older versions."""
+    path = work_dir / f'{name}.safetensors'
+    if path.exists():
+        return load_stats(path)
+    return torch.load(work_dir / f'{name}.pth')
+
+
+def _save_axis_params(out_dir: Path, layer_idx: int, tp_rank: int,
+                      kind: str, *params: torch.Tensor) -> None:
+    """Write the key (`kind='k'`) or value (`kind='v'`) params of one layer
+    and TP rank along the quantization axis they were calibrated for.
+
+    Each param has shape (heads // tp, head_dim) for per-channel stats and
+    (heads // tp, 1) for per-token ones, whose scales are computed at
+    runtime and bounded by these per-head ranges. They are stacked and
+    written as float32 next to the per-layer scalars the int8 KV cache
+    reads.
+    """
+    name = f'layers.{layer_idx}.past_{kind}_scale.{tp_rank}.weight'
+    torch.stack(params).float().numpy().tofile(out_dir / name)
+
 
 def _export_sym(key_stats: dict,
                 value_stats: dict,
                 bits: int,
                 out_dir: Union[str, Path],
                 tp: int = 1) -> None:
-    """Export symmetric quantization parameters to specified directory."""
+    """Export symmetric quantization parameters to specified directory: the
+    per-layer scales, and the scales along the quantization axes."""
     keys_absmax = key_stats['absmax']
     values_absmax = value_stats['absmax']
     for layer_idx, name in enumerate(keys_absmax.keys()):
@@ -33,6 +60,10 @@ def _export_sym(key_stats: dict,
             kv_qparams = np.array([k_s, v_s], dtype=np.float32)
             out_path = out_dir / f'layers.{layer_idx}.past_kv_scale.{i}.weight'  # noqa: E501
             kv_qparams.tofile(out_path)
+            _save_axis_params(out_dir, layer_idx, i, 'k',
+                              mp_k_absmax[i] / (2**(bits - 1) - 1))
+            _save_axis_params(out_dir, layer_idx, i, 'v',
+                              mp_v_absmax[i] / (2**(bits - 1) - 1))
             print(f'Layer {layer_idx} MP {i} qparam: {k_s} \t{v_s}')
 
 
@@ -41,7 +72,9 @@ def _export_asym(key_stats: dict,
                  bits: int,
                  out_dir: Union[str, Path],
                  tp: int = 1) -> None:
-    """Export asymmetric quantization parameters to specified directory."""
+    """Export asymmetric quantization parameters to specified directory: the
+    per-layer scales and zero points, and the scales and zero points along
+    the quantization axes."""
     keys_min = key_stats['min']
     values_min = value_stats['min']
 
@@ -83,6 +116,12 @@ def _export_asym(key_stats: dict,
                                   dtype=np.float32)
             out_path = out_dir / f'layers.{layer_idx}.past_kv_scale.{i}.weight'
             kv_qparams.tofile(out_path)
+            _save_axis_params(out_dir, layer_idx, i, 'k',
+                              (tp_k_max[i] - tp_k_min[i]) / (2**bits - 1),
+                              (tp_k_max[i] + tp_k_min[i]) / 2)
+            _save_axis_params(out_dir, layer_idx, i, 'v',
+                              (tp_v_max[i] - tp_v_min[i]) / (2**bits - 1),
+                              (tp_v_max[i] + tp_v_min[i]) / 2)
             print(f'Layer {layer_idx} MP {i} qparam: '
                   f'\t{k_scale} \t{k_zp} \t{v_scale} \t{v_zp}')
 
@@ -109,8 +148,8 @@ def main(work_dir: str,
     tm_dir = Path(kv_params_dir)
     tm_dir.mkdir(parents=True, exist_ok=True)
 
-    key_stats = torch.load(work_dir / 'key_stats.pth')
-    value_stats = torch.load(work_dir / 'value_stats.pth')
+    key_stats = _load_stats(work_dir, 'key_stats')
+    value_stats = _load_stats(work_dir, 'value_stats')
 
     if kv_sym:
         _export_sym(key_stats, value_stats, kv_bits, tm_dir, num_tp)
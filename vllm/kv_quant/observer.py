@@ -83,23 +83,29 @@ class KVCacheObserver(GlobalAvailMixin):
     """A class to observe and record the max, min, and absolute max value of
     given tensor."""
 
-    def __init__(self, num_head: int, head_dim: int) -> None:
+    def __init__(self,
+                 num_head: int,
+                 head_dim: int,
+                 axis: str = 'channel') -> None:
         """Constructor for KVCacheObserver.
         Args:
             num_head : Number of heads
             head_dim : Dimension of each head
+            axis : Quantization axis the stats are collected for. 'channel'
+                keeps stats of shape (num_head, head_dim), 'token' reduces
+                them over the channels to (num_head, 1), since per-token
+                scales are computed from each token at runtime and only
+                their per-head bound can be calibrated.
         """
+        assert axis in ('channel', 'token'), \
+            f'Unsupported quantization axis {axis!r}'
         self.num_head = num_head
         self.head_dim = head_dim
-        self.max_val = torch.full((num_head, head_dim),
-                                  -torch.inf,
-                                  dtype=torch.float16)
-        self.min_val = torch.full((num_head, head_dim),
-                                  torch.inf,
-                                  dtype=torch.float16)
-        self.absmax_val = torch.full((num_head, head_dim),
-                                     0,
-                                     dtype=torch.float16)
+        self.axis = axis
+        shape = (num_head, head_dim if axis == 'channel' else 1)
+        self.max_val = torch.full(shape, -torch.inf, dtype=torch.float16)
+        self.min_val = torch.full(shape, torch.inf, dtype=torch.float16)
+        self.absmax_val = torch.full(shape, 0, dtype=torch.float16)
 
     @torch.no_grad()
     def observe(self, x: torch.Tensor) -> None:
@@ -118,9 +124,15 @@ class KVCacheObserver(GlobalAvailMixin):
                                'expected (bs, num_head, seqlen, head_dim) '
                                'or (bs, seqlen, num_head, head_dim)')
 
-        cur_max = x.flatten(0, 1).max(0)[0].cpu()
-        cur_min = x.flatten(0, 1).min(0)[0].cpu()
-        cur_absmax = x.flatten(0, 1).abs().max(0)[0].cpu()
+        cur_max = x.flatten(0, 1).max(0)[0]
+        cur_min = x.flatten(0, 1).min(0)[0]
+        cur_absmax = x.flatten(0, 1).abs().max(0)[0]
+        if self.axis == 'token':
+            cur_max = cur_max.max(-1, keepdim=True)[0]
+            cur_min = cur_min.min(-1, keepdim=True)[0]
+            cur_absmax = cur_absmax.max(-1, keepdim=True)[0]
+        cur_max, cur_min = cur_max.cpu(), cur_min.cpu()
+        cur_absmax = cur_absmax.cpu()
 
         self.max_val = torch.maximum(self.max_val, cur_max)
         self.min_val = torch.minimum(self.min_val, cur_min)
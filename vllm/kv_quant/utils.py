@@ -1,7 +1,11 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+import json
+from pathlib import Path
 from typing import Any, Dict, List, Tuple, Union
 
 import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
 from torch import nn
 
 
@@ -154,4 +158,42 @@ def bimap_name_mod(
     for mapping in name2mod_mappings:
         mod2name.update({v: k for k, v in mapping.items()})
         name2mod.update(mapping)
-    return name2mod, mod2name
\ No newline at end of file
+    return name2mod, mod2name
+
+
+def save_stats(stats: Dict[str, Dict[str, torch.Tensor]],
+               path: Union[str, Path]) -> None:
+    """Saves calibration statistics as a safetensors file.
+    Args:
+        stats : Mapping from a statistic (e.g. 'absmax') to a mapping from
+            module names to the observed tensors.
+        path : The file to write.
+    """
+    # safetensors does not keep insertion order, so the module order (which
+    # gives the layer index on export) is recorded in the metadata.
+    names = list(next(iter(stats.values()), {}))
+    tensors = {
+        f'{stat}:{name}': val.contiguous().cpu()
+        for stat, name2val in stats.items() for name, val in name2val.items()
+    }
+    metadata = {'stats': json.dumps(list(stats)), 'names': json.dumps(names)}
+    save_file(tensors, str(path), metadata=metadata)
+
+
+def load_stats(path: Union[str, Path]) -> Dict[str, Dict[str, torch.Tensor]]:
+    """Loads calibration statistics saved by `save_stats`, keeping the
+    original module order.
+    Args:
+        path : The file to read.
+    Returns:
+        Mapping from a statistic to a mapping from module names to tensors.
+    """
+    with safe_open(str(path), framework='pt') as f:
+        metadata = f.metadata()
+        return {
+            stat: {
+                name: f.get_tensor(f'{stat}:{name}')
+                for name in json.loads(metadata['names'])
+            }
+            for stat in json.loads(metadata['stats'])
+        }